@@ -0,0 +1,95 @@
+"""
+Drives fetch_products_paginated against the local fake catalog server with
+every Nth request failing, once per worker count, and checks that retries
+still recover the complete catalog. Then fills a CatalogCache through
+fetch_products_cached and revalidates it, which should come back as 304s
+with the same products.
+
+Usage: python benchmarks/bench_catalog_fetch.py [--products 5000] [--page-size 100]
+       [--workers 1 8] [--fail-every 7] [--delay 0.05]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.fake_catalog_server import make_server
+from utils.api_handler import fetch_products_cached, fetch_products_paginated
+from utils.catalog_cache import CatalogCache
+from utils.metrics import collect_metrics
+
+
+def serving(products, fail_every, delay):
+    server = make_server(product_count=products, fail_every=fail_every, delay=delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def timed(fetch):
+    with collect_metrics() as metrics:
+        start = time.perf_counter()
+        result = fetch()
+        elapsed = time.perf_counter() - start
+    return result, elapsed, metrics
+
+
+def api_line(metrics):
+    return (
+        f"{len(metrics.api_latencies):5d} requests {metrics.api_retries:4d} retries "
+        f"{metrics.api_failures:4d} failed"
+    )
+
+
+def check(ids, products, label):
+    if sorted(ids) != list(range(1, products + 1)):
+        raise SystemExit(f"{label}: got {len(ids)} of {products} products")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--fail-every", type=int, default=7)
+    parser.add_argument("--delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(
+        f"{args.products} products, pages of {args.page_size}, every {args.fail_every}th "
+        f"request fails, {args.delay:.2f}s per response"
+    )
+    for workers in args.workers:
+        server = serving(args.products, args.fail_every, args.delay)
+        try:
+            base_url = f"http://127.0.0.1:{server.server_port}/"
+            mapping, elapsed, metrics = timed(lambda: fetch_products_paginated(
+                page_size=args.page_size, max_workers=workers, base_url=base_url,
+                retries=5, backoff=0.01,
+            ))
+        finally:
+            server.shutdown()
+        check(mapping, args.products, f"{workers} workers")
+        print(f"paginated {workers:2d} workers {elapsed:7.2f}s  {api_line(metrics)}")
+
+    server = serving(args.products, args.fail_every, args.delay)
+    try:
+        base_url = f"http://127.0.0.1:{server.server_port}/"
+        with tempfile.TemporaryDirectory() as tmp:
+            # ttl 0: every call after the first revalidates the cached pages
+            cache = CatalogCache(cache_dir=tmp, ttl=0, stale_ttl=0)
+            for label in ("cache fill", "revalidate"):
+                products, elapsed, metrics = timed(lambda: fetch_products_cached(
+                    args.products, base_url, cache, args.page_size, max(args.workers),
+                ))
+                check([p["id"] for p in products], args.products, label)
+                print(f"{label:<20} {elapsed:7.2f}s  {api_line(metrics)}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
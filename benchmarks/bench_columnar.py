@@ -0,0 +1,85 @@
+"""
+Compares the dict-based metrics in utils.data_processor with the vectorized
+ones in utils.columnar on synthetic transactions, checking that both return
+identical results.
+
+Usage: python benchmarks/bench_columnar.py [--rows 1000000 10000000] [--seed 7]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import columnar, data_processor
+from utils.aggregation import REGIONS
+from utils.money import PAISE_PER_RUPEE
+
+METRICS = (
+    ("calculate_total_revenue", ()),
+    ("region_wise_sale", (False,)),
+    ("top_selling_products", (5,)),
+    ("customer_analysis", (False,)),
+    ("daily_sales_trend", (False,)),
+    ("find_peak_sales_day", ()),
+    ("low_performing_products", (10,)),
+)
+
+
+def synthetic_transactions(rows, products=200, customers=50000, days=365, seed=7):
+    rng = random.Random(seed)
+    product_names = [f"Product {i}" for i in range(products)]
+    customer_ids = [f"C{i:06d}" for i in range(customers)]
+    dates = [f"2024-{1 + d // 31 % 12:02d}-{1 + d % 28:02d}" for d in range(days)]
+    for i in range(rows):
+        yield {
+            "TransactionID": f"T{i}",
+            "Date": rng.choice(dates),
+            "ProductID": f"P{rng.randrange(products)}",
+            "ProductName": rng.choice(product_names),
+            "Quantity": rng.randint(1, 10),
+            "UnitPrice": rng.randint(100, 90000) * PAISE_PER_RUPEE,
+            "CustomerID": rng.choice(customer_ids),
+            "Region": rng.choice(REGIONS),
+        }
+
+
+def run(rows, seed=7):
+    transactions = list(synthetic_transactions(rows, seed=seed))
+
+    start = time.perf_counter()
+    aggregate = data_processor.aggregate_sales(transactions)
+    expected = {name: getattr(data_processor, name)(aggregate, *args) for name, args in METRICS}
+    dict_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store = columnar.ColumnarTransactions.from_transactions(transactions)
+    encode_seconds = time.perf_counter() - start
+    del transactions
+
+    start = time.perf_counter()
+    actual = {name: getattr(columnar, name)(store, *args) for name, args in METRICS}
+    vector_seconds = time.perf_counter() - start
+
+    mismatched = [name for name in expected if expected[name] != actual[name]]
+    print(
+        f"{rows:>10} rows | dict path {dict_seconds:8.2f}s | "
+        f"encode {encode_seconds:8.2f}s | vectorized {vector_seconds:8.2f}s | "
+        f"speedup {dict_seconds / vector_seconds:6.1f}x | "
+        f"{'match' if not mismatched else 'MISMATCH: ' + ', '.join(mismatched)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    for rows in args.rows:
+        run(rows, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Checks that the catalog fetch overlaps cleaning and parsing: runs
+`main.py clean report` against a local catalog server that holds every
+response for --delay seconds, once with --sequential and once pipelined.
+The pipelined run should take about max(fetch, clean + parse) + enrich +
+report rather than the sum.
+
+Usage: python benchmarks/bench_overlap.py [--rows 500000] [--delay 2.0]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as pipeline
+from benchmarks.generate_sales_data import write_sales_file
+from tools.fake_catalog_server import make_server
+from utils.parse_cache import PARSE_CACHE
+
+
+def timed_run(argv):
+    PARSE_CACHE.clear()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline.main(argv)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--delay", type=float, default=2.0)
+    args = parser.parse_args()
+
+    server = make_server(delay=args.delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            sales_file = write_sales_file(os.path.join(tmp, "sales_data.txt"), args.rows)
+            argv = [
+                "clean", "report", "--no-cache",
+                "--input", sales_file,
+                "--cleaned", os.path.join(tmp, "first_question.txt"),
+                "--enriched", os.path.join(tmp, "enriched_sales_data.txt"),
+                "--report", os.path.join(tmp, "sales_report.txt"),
+                "--base-url", f"http://127.0.0.1:{server.server_port}/",
+            ]
+            sequential = timed_run(argv + ["--sequential"])
+            pipelined = timed_run(argv)
+    finally:
+        server.shutdown()
+
+    print(f"{args.rows} rows, catalog delay {args.delay:.1f}s")
+    print(f"sequential {sequential:8.2f}s")
+    print(f"pipelined  {pipelined:8.2f}s  (saved {sequential - pipelined:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
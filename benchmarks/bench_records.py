@@ -0,0 +1,44 @@
+"""
+Measures per-row memory of parsed transactions: plain dicts (parse_row)
+versus compact Transaction records (parse_record).
+
+Usage: python benchmarks/bench_records.py [rows]   (default: 5000000)
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate_sales_data import write_sales_file
+from utils.file_handler import iter_mmap_transactions
+
+
+def measure(path, compact):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    transactions = list(iter_mmap_transactions(path, clean=False, compact=compact))
+    seconds = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rows = len(transactions)
+    del transactions
+    return rows, current / rows, seconds
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sales.txt")
+        write_sales_file(path, rows, products=200, customers=50000, days=365)
+        for label, compact in (("dict records", False), ("Transaction records", True)):
+            count, per_row, seconds = measure(path, compact)
+            print(f"{label:<20} {count:>10} rows | {per_row:8.1f} bytes/row | parse {seconds:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Writes synthetic pipe-delimited sales files shaped like Data/sales_data.txt,
+quirks included: comma-thousands unit prices, TransactionIDs / CustomerIDs
+without their T / C prefix (or missing), zero and negative quantities,
+commas inside ProductName and blank lines.
+
+Usage: python benchmarks/generate_sales_data.py OUTPUT [--rows 1000000]
+       [--products 10] [--customers 30] [--start-date 2024-12-01]
+       [--days 31] [--seed 7]
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.aggregation import REGIONS
+from utils.transactions import TRANSACTION_FIELDS
+
+# (name, low price, high price, variant) for the products in the real file;
+# larger catalogs cycle through them with a numeric suffix
+BASE_PRODUCTS = (
+    ("Laptop", 15000, 90000, "Premium"),
+    ("Mouse", 100, 1500, "Wireless"),
+    ("Keyboard", 300, 3500, "Mechanical"),
+    ("Monitor", 5000, 25000, "LED"),
+    ("Webcam", 800, 4000, "HD"),
+    ("Headphones", 500, 5000, "Bluetooth"),
+    ("USB Cable", 100, 500, "Type-C"),
+    ("External Hard Drive", 3000, 9000, "1TB"),
+    ("Wireless Mouse", 300, 2000, "Gaming"),
+    ("Laptop Charger", 800, 3000, "65W"),
+)
+
+# rough rates observed in Data/sales_data.txt
+DEFAULT_QUIRKS = {
+    "thousands_separator": 0.5,   # share of prices >= 1000 written as "1,916"
+    "comma_in_name": 0.15,        # "Laptop,Premium" instead of "Laptop"
+    "bad_transaction_id": 0.03,   # "X611" instead of "T611"
+    "bad_customer_id": 0.02,      # "" or "X023" instead of "C023"
+    "zero_quantity": 0.02,
+    "negative_quantity": 0.01,
+    "blank_line": 0.01,
+}
+
+
+def make_catalog(products):
+    catalog = []
+    for i in range(products):
+        name, low, high, variant = BASE_PRODUCTS[i % len(BASE_PRODUCTS)]
+        if i >= len(BASE_PRODUCTS):
+            name = f"{name} {i // len(BASE_PRODUCTS) + 1}"
+        catalog.append((f"P{101 + i}", name, low, high, variant))
+    return catalog
+
+
+def iter_sales_lines(rows, products=10, customers=30, start_date="2024-12-01",
+                     days=31, seed=7, quirks=None):
+    """
+    Yields the header and then rows data lines (blank lines come on top of
+    rows), each ending in a newline. The same arguments always produce the
+    same file.
+    """
+    rates = dict(DEFAULT_QUIRKS, **(quirks or {}))
+    rng = random.Random(seed)
+    random_value = rng.random
+    catalog = make_catalog(products)
+    first_day = date.fromisoformat(start_date)
+    dates = [(first_day + timedelta(days=d)).isoformat() for d in range(days)]
+    customer_ids = [f"{i:03d}" for i in range(1, customers + 1)]
+    id_width = max(3, len(str(rows)))
+
+    yield "|".join(TRANSACTION_FIELDS) + "\n"
+    for i in range(1, rows + 1):
+        if random_value() < rates["blank_line"]:
+            yield "\n"
+
+        transaction_id = f"{i:0{id_width}d}"
+        transaction_id = ("X" if random_value() < rates["bad_transaction_id"] else "T") + transaction_id
+
+        product_id, name, low, high, variant = rng.choice(catalog)
+        if random_value() < rates["comma_in_name"]:
+            name = f"{name},{variant}"
+
+        quantity = rng.randint(1, 10)
+        roll = random_value()
+        if roll < rates["zero_quantity"]:
+            quantity = 0
+        elif roll < rates["zero_quantity"] + rates["negative_quantity"]:
+            quantity = -quantity
+
+        price = rng.randint(low, high)
+        if price >= 1000 and random_value() < rates["thousands_separator"]:
+            price = f"{price:,}"
+
+        customer_id = "C" + rng.choice(customer_ids)
+        if random_value() < rates["bad_customer_id"]:
+            customer_id = "" if random_value() < 0.5 else "X" + customer_id[1:]
+
+        yield (
+            f"{transaction_id}|{rng.choice(dates)}|{product_id}|{name}|{quantity}|"
+            f"{price}|{customer_id}|{rng.choice(REGIONS)}\n"
+        )
+
+
+def write_sales_file(path, rows, **options):
+    """Writes a synthetic sales file (see iter_sales_lines) and returns path."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(iter_sales_lines(rows, **options))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("output")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--customers", type=int, default=30)
+    parser.add_argument("--start-date", default="2024-12-01")
+    parser.add_argument("--days", type=int, default=31)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    write_sales_file(
+        args.output, args.rows, products=args.products, customers=args.customers,
+        start_date=args.start_date, days=args.days, seed=args.seed,
+    )
+    print(f"Wrote {args.rows} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
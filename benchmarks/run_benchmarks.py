@@ -0,0 +1,196 @@
+"""
+Times and memory-profiles every pipeline stage in main.py on synthetic
+sales files (see generate_sales_data.py) and appends the results to a
+JSON-lines history, so runs can be compared over time.
+
+Each size runs in a scratch directory laid out like the repo (Data/,
+Output/), so the stages are called exactly as main() calls them. Stages
+run once for wall time; with --memory they run a second time under
+tracemalloc for the peak of memory allocated during the stage.
+
+Usage: python benchmarks/run_benchmarks.py [--sizes 10000 1000000 10000000]
+       [--memory] [--history benchmarks/results/history.jsonl]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import main as pipeline
+from benchmarks.generate_sales_data import write_sales_file
+from tools.fake_catalog_server import fake_products
+from utils.api_handler import create_product_mapping, enrich_sales_data
+
+DEFAULT_SIZES = (10_000, 1_000_000, 10_000_000)
+DEFAULT_HISTORY = os.path.join(REPO_ROOT, "benchmarks", "results", "history.jsonl")
+
+METRICS = (
+    ("calculate_total_revenue", ()),
+    ("region_wise_sale", ()),
+    ("top_selling_products", ()),
+    ("customer_analysis", ()),
+    ("daily_sales_trend", ()),
+    ("find_peak_sales_day", ()),
+    ("low_performing_products", (6,)),
+)
+
+
+def stages(product_mapping):
+    """(name, fn(state)) in pipeline order; state carries results between stages."""
+    def parse(state):
+        # bypass the parse cache so every run measures a real parse
+        state["transactions"] = pipeline.parse_transactions(cache=None)
+
+    def validate(state):
+        state["valid"] = pipeline.validate_and_filter(state["transactions"])[0]
+
+    def enrich(state):
+        state["enriched"] = enrich_sales_data(state["transactions"], product_mapping)
+
+    def report(state):
+        pipeline.generate_sales_report(state["transactions"], state["enriched"])
+
+    def metric(name, args):
+        fn = getattr(pipeline, name)
+        return lambda state: fn(state["transactions"], *args)
+
+    return (
+        [
+            ("handleQuestionOne", lambda state: pipeline.handleQuestionOne()),
+            ("parse_transactions", parse),
+            ("validate_and_filter", validate),
+        ]
+        + [(name, metric(name, args)) for name, args in METRICS]
+        + [
+            ("enrich_sales_data", enrich),
+            ("generate_sales_report", report),
+        ]
+    )
+
+
+def run_stages(product_mapping, memory):
+    results = {}
+    state = {}
+    for name, fn in stages(product_mapping):
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn(state)
+        seconds = time.perf_counter() - start
+        result = {"seconds": seconds}
+        if memory:
+            result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        results[name] = result
+    return results
+
+
+def benchmark(rows, memory=False, products=10, customers=1000, days=365, seed=7):
+    product_mapping = create_product_mapping(fake_products(100 + products))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        write_sales_file(
+            os.path.join(workdir, "Data", "sales_data.txt"), rows,
+            products=products, customers=customers, days=days, seed=seed,
+        )
+        os.makedirs(os.path.join(workdir, "Output"))
+        os.chdir(workdir)
+        try:
+            results = run_stages(product_mapping, memory=False)
+            if memory:
+                for name, result in run_stages(product_mapping, memory=True).items():
+                    results[name]["peak_bytes"] = result["peak_bytes"]
+        finally:
+            os.chdir(cwd)
+    for result in results.values():
+        result["rows_per_second"] = rows / result["seconds"] if result["seconds"] else None
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def append_history(path, entry):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def print_results(entry, previous):
+    previous_stages = previous["stages"] if previous else {}
+    print(f"\n{entry['rows']:,} rows (commit {entry['commit'] or 'unknown'})")
+    print(f"{'Stage':<26}{'Seconds':>10}{'Rows/s':>14}{'Peak MiB':>10}{'vs last':>10}")
+    for name, result in entry["stages"].items():
+        peak = result.get("peak_bytes")
+        before = previous_stages.get(name)
+        change = (
+            f"{(result['seconds'] / before['seconds'] - 1) * 100:+.1f}%"
+            if before and before["seconds"] else ""
+        )
+        print(
+            f"{name:<26}{result['seconds']:>10.3f}"
+            f"{result['rows_per_second'] or 0:>14,.0f}"
+            f"{(f'{peak / 2 ** 20:.1f}' if peak is not None else '-'):>10}"
+            f"{change:>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--memory", action="store_true", help="also record tracemalloc peaks")
+    parser.add_argument("--history", default=DEFAULT_HISTORY)
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    history = load_history(args.history)
+    commit = git_commit()
+    for rows in args.sizes:
+        entry = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rows": rows,
+            "stages": benchmark(
+                rows, args.memory, args.products, args.customers, args.days, args.seed
+            ),
+        }
+        previous = next((e for e in reversed(history) if e["rows"] == rows), None)
+        print_results(entry, previous)
+        append_history(args.history, entry)
+        history.append(entry)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,18 @@
+import argparse
+import contextlib
 import logging
 import json
+import os
+import threading
+from concurrent.futures import Future
 from datetime import datetime
 
+from utils.aggregation import SalesAggregate
+
 from utils.data_processor import (
+    aggregate_sales,
+    new_filter_summary,
+    iter_validate_and_filter,
     calculate_total_revenue,
     region_wise_sale,
     top_selling_products,
@@ -12,56 +22,66 @@ from utils.data_processor import (
     low_performing_products,
 )
 
-from utils.api_handler import (
-    fetch_all_products,
-    create_product_mapping,
-    enrich_sales_data,
+from utils.file_handler import (
+    open_with_fallback_encodings,
+    iter_clean_rows,
+    iter_parse_rows,
+    iter_mmap_transactions,
 )
 
-def open_with_fallback_encodings(path, encodings=("utf-8", "latin-1", "cp1252")):
-    for enc in encodings:
-        try:
-            return open(path, "r", encoding=enc)
-        except UnicodeDecodeError:
-            continue
-    raise UnicodeDecodeError("utf-8", b"", 0, 1, "Unable to decode file")
+from utils.metrics import collect_metrics, instrumented, metrics_path_for, stage
 
-def safe_to_int(val):
-    try:
-        return int(val.replace(",", ""))
-    except (ValueError, AttributeError):
-        return 0
+from utils.money import divide_paise, format_paise
+
+from utils.parse_cache import PARSE_CACHE, ParseCache
+
+from utils.query_index import TransactionIndex
+
+from utils.transactions import TransactionBatch, as_batch
+
+from utils.validation import INGEST_RULES
+
+# utils.api_handler (requests), utils.incremental and utils.parallel_ingest
+# are imported by the stages that need them, so runs that never touch the
+# catalog start without loading the HTTP stack
+
+DATA_DIR = "Data"
+OUTPUT_DIR = "Output"
+SALES_FILE = os.path.join(DATA_DIR, "sales_data.txt")
+ENRICHED_FILE = os.path.join(DATA_DIR, "enriched_sales_data.txt")
+CLEANED_FILE = os.path.join(OUTPUT_DIR, "first_question.txt")
+REPORT_FILE = os.path.join(OUTPUT_DIR, "sales_report.txt")
+REPORT_STATE_FILE = os.path.join(OUTPUT_DIR, "report_state.json")
+REJECT_FILE = os.path.join(OUTPUT_DIR, "rejected_rows.txt")
+
+def print_rejects(counters):
+    rejected = counters.get("rejected")
+    if rejected:
+        print("Rejected by rule: " + ", ".join(f"{rule}={n}" for rule, n in rejected.items()))
 
-def handleQuestionOne():
+def handleQuestionOne(input_file=SALES_FILE, output_file=CLEANED_FILE, reject_file=REJECT_FILE):
+    # rows breaking a cleaning rule (utils.validation) are counted per rule
+    # and copied to reject_file tagged with the rule; they never abort the run
     try:
-        total_records = 0
-        invalid_records = 0
-        INPUT_FILE = './data/sales_data.txt'
-        OUTPUT_FILE = './output/first_question.txt'
-        with open_with_fallback_encodings(INPUT_FILE) as infile, open(OUTPUT_FILE, 'w') as outfile:
+        counters = {"total": 0, "invalid": 0, "rejected": {}}
+        with stage("handleQuestionOne") as record, \
+                open_with_fallback_encodings(input_file) as infile, \
+                open(output_file, 'w') as outfile, \
+                (open(reject_file, 'w') if reject_file else contextlib.nullcontext()) as rejects:
             header = infile.readline().strip()
             outfile.write(header + "\n")
-            for line in infile:
-                row = line.strip()
-
-                if not row:
-                    continue
-                total_records +=1
-
-                row = row.split('|')
-                if not row[6].startswith('C'):
-                    invalid_records +=1
-                    continue
-                if int(row[4]) < 0 or safe_to_int(row[5]) < 0:
-                    invalid_records +=1
-                    continue
-                if not row[0].startswith('T'):
-                    invalid_records +=1
-                    continue
+            if rejects is not None:
+                rejects.write(f"Rule|{header}\n")
+            for row in iter_clean_rows(infile, counters, rejects=rejects):
                 outfile.write("|".join(row) + "\n")
+            total_records = counters["total"]
+            invalid_records = counters["invalid"]
+            record.rows_in = total_records
+            record.rows_out = total_records - invalid_records
             print(f'Total records passed: {total_records}')
             print(f'Invalid records removed: {invalid_records}')
             print(f'Valid records after cleaning: {total_records - invalid_records}')
+            print_rejects(counters)
 
     except FileNotFoundError as e:
         logging.error(f"Input file not found: {e.filename}")
@@ -77,11 +97,10 @@ def handleQuestionOne():
     return
 
 # Q2 TASK 1.1
-def read_sale_data():
+def read_sale_data(input_file=CLEANED_FILE):
     try:
         out = []
-        INPUT_FILE = './output/first_question.txt'
-        with open_with_fallback_encodings(INPUT_FILE) as infile:
+        with open_with_fallback_encodings(input_file) as infile:
             _ = infile.readline().strip()
             for line in infile:
                 row = line.strip()
@@ -104,36 +123,21 @@ def read_sale_data():
     return
 
 # Q2 TASK 1.2
-def parse_transactions():
+@instrumented()
+def parse_transactions(compact=False, input_file=CLEANED_FILE, cache=PARSE_CACHE):
     try:
-        out = []
-        INPUT_FILE = "./output/first_question.txt"
-        with open_with_fallback_encodings(INPUT_FILE) as infile:
-            headings = infile.readline().strip().split("|")
-            for line in infile:
-                row = line.strip()
-                if not row:
-                    continue
-                row_data = row.split("|")
-                json_data = {}
-                for index, r in enumerate(row_data):
-                    if headings[index] == "Quantity":
-                        json_data[headings[index]] = int(r)
-                    elif headings[index] == "Date":
-                        json_data[headings[index]] = datetime.strptime(
-                            r, "%Y-%m-%d"
-                        ).date().isoformat()
-                    elif headings[index] == "ProductName":
-                        json_data[headings[index]] = r.replace(",", " ")
-                    elif headings[index] == "UnitPrice":
-                        json_data[headings[index]] = float(safe_to_int(r))
-                    else:
-                        json_data[headings[index]] = r
-
-                out.append(json_data)
-
-        # print(json.dumps(out, indent=4))
-        return json.dumps(out, indent=4)
+        # compact=True yields slotted Transaction records instead of dicts;
+        # an unchanged file is served from the parse cache (cache=None to skip it)
+        def parse(path):
+            return TransactionBatch(iter_mmap_transactions(path, clean=False, compact=compact))
+
+        if cache is None:
+            out = parse(input_file)
+        else:
+            out = cache.get(input_file, parse, "compact" if compact else "")
+
+        # print(out.to_json())
+        return out
 
     except FileNotFoundError as e:
         logging.error(f"Input file not found: {e.filename}")
@@ -148,80 +152,141 @@ def parse_transactions():
     return
 
 def validate_and_filter(transactions, region=None, min_amount=None, max_amount=None):
-    transactions = json.loads(transactions)
-    filtered_by_region = 0
-    filtered_by_amount = 0
-    valid_transaction, invalid_count, filter_summary = (
-        [],
-        0,
-        {
-            "total_input": len(transactions),
-            "invalid": 0,
-            "filtered_by_region": 0,
-            "filtered_by_amount": 0,
-            "final_count": 0,
-        },
-    )
-    for transaction in transactions:
-        if transaction.get("Quantity", 0) <= 0 or transaction.get("UnitPrice", 0) <= 0:
-            invalid_count += 1
-            continue
-
-        amount = transaction.get("Quantity", 0) * transaction.get("UnitPrice", 0)
-
-        if region and region != transaction.get("Region"):
-            filtered_by_region += 1
-            continue
-
-        if min_amount is not None and amount < min_amount:
-            filtered_by_amount += 1
-            continue
+    # pass a TransactionIndex (utils.query_index) to answer repeated
+    # region/amount queries over the same data without rescanning it
+    filter_summary = new_filter_summary()
+    with stage("validate_and_filter") as record:
+        if isinstance(transactions, TransactionIndex):
+            matches, filter_summary = transactions.query(region, min_amount, max_amount)
+            valid_transaction = TransactionBatch(matches)
+        else:
+            valid_transaction = TransactionBatch(
+                iter_validate_and_filter(
+                    as_batch(transactions), filter_summary, region, min_amount, max_amount
+                )
+            )
+        record.rows_in = filter_summary["total_input"]
+        record.rows_out = filter_summary["final_count"]
+    return (valid_transaction, filter_summary["invalid"], filter_summary)
 
-        if max_amount is not None and amount > max_amount:
-            filtered_by_amount += 1
-            continue
+def format_currency(paise):
+    return format_paise(paise)
 
-        valid_transaction.append(transaction)
+def truncate(text, width):
+    return text if len(text) <= width else text[:width-3] + "..."
 
-    filter_summary["invalid"] = invalid_count
-    filter_summary["filtered_by_region"] = filtered_by_region
-    filter_summary["filtered_by_amount"] = filtered_by_amount
-    filter_summary["final_count"] = len(valid_transaction)
 
-    return (valid_transaction, invalid_count, filter_summary)
+@instrumented()
+def generate_sales_report(transactions, enriched_transactions, output_file=REPORT_FILE, sketch=False):
+    # one parse and one scan: every metric in the report is a view over this aggregate
+    aggregate = aggregate_sales(transactions, sketch=sketch)
+    if hasattr(enriched_transactions, "iter_pairs"):
+        # EnrichedBatch: (transaction, catalog entry) without row views
+        for txn, enrichment in enriched_transactions.iter_pairs():
+            aggregate.add_enrichment(txn, enrichment)
+    else:
+        for txn in enriched_transactions:
+            aggregate.add_enrichment(txn)
+    write_sales_report(aggregate, output_file)
+    return
 
-def format_currency(value):
-    return f"₹{value:,.2f}"
 
-def truncate(text, width):
-    return text if len(text) <= width else text[:width-3] + "..."
+def stream_sales_report(
+    input_file=SALES_FILE,
+    output_file=REPORT_FILE,
+    product_mapping=None,
+    region=None,
+    min_amount=None,
+    max_amount=None,
+    enriched_file=ENRICHED_FILE,
+    sketch=False,
+    reject_file=None,
+):
+    """
+    End-to-end streaming mode: clean -> parse -> validate/filter -> enrich
+    -> aggregate as chained generators over the raw sales file.
+
+    Rows are never collected into a batch, so memory is bounded by the
+    number of distinct regions/products/customers/days rather than by the
+    file size. The cleaning and validity rules are checked together in one
+    compiled predicate on the raw rows (INGEST_RULES), so both kinds of
+    reject are counted in the cleaning counters and written to reject_file;
+    rows outside the optional region/amount filters are left out of the
+    report. sketch=True also bounds the per-customer/per-day state (see
+    SalesAggregate).
+    """
+    from utils.api_handler import iter_enrich_sales_data, iter_save_enriched_data
+
+    clean_counters = {"total": 0, "invalid": 0, "rejected": {}}
+    filter_summary = new_filter_summary()
+    aggregate = SalesAggregate(sketch=sketch)
+    with stage("stream_sales_report") as record, \
+            open_with_fallback_encodings(input_file) as infile, \
+            (open(reject_file, "w") if reject_file else contextlib.nullcontext()) as rejects:
+        header = infile.readline().strip()
+        headings = header.split("|")
+        if rejects is not None:
+            rejects.write(f"Rule|{header}\n")
+        rows = iter_clean_rows(infile, clean_counters, INGEST_RULES, rejects)
+        transactions = iter_parse_rows(rows, headings)
+        transactions = iter_validate_and_filter(
+            transactions, filter_summary, region, min_amount, max_amount, rules=None
+        )
+        transactions = iter_enrich_sales_data(transactions, product_mapping or {})
+        if enriched_file:
+            transactions = iter_save_enriched_data(transactions, enriched_file)
+        for row in transactions:
+            # EnrichedRow: aggregate the base record, count its catalog entry
+            aggregate.add(row.transaction)
+            aggregate.add_enrichment(row.transaction, row.enrichment)
+        record.rows_in = clean_counters["total"]
+        record.rows_out = filter_summary["final_count"]
+
+    write_sales_report(aggregate, output_file)
+    return (clean_counters, filter_summary)
+
+
+@instrumented()
+def incremental_sales_report(
+    input_file=CLEANED_FILE,
+    output_file=REPORT_FILE,
+    state_file=REPORT_STATE_FILE,
+    product_mapping=None,
+):
+    """
+    Report over an append-only cleaned file that only parses rows added
+    since the last run (see utils.incremental.update_sales_aggregate).
+    """
+    from utils.incremental import update_sales_aggregate
+
+    aggregate, rows_added, rebuilt = update_sales_aggregate(input_file, state_file, product_mapping)
+    print(f"{'Rebuilt' if rebuilt else 'Updated'} report state with {rows_added} new records")
+    write_sales_report(aggregate, output_file)
+    return
 
 
-def generate_sales_report(transactions, enriched_transactions, output_file="output/sales_report.txt"):
+@instrumented()
+def write_sales_report(aggregate, output_file=REPORT_FILE):
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    transactions = json.loads(transactions)
-    total_records = len(transactions)
-
-    dates = sorted(t["Date"] for t in transactions)
-    date_range = f"{dates[0]} to {dates[-1]}"
-
-    transactions = json.dumps(transactions)
+    total_records = aggregate.record_count
 
-    total_revenue = calculate_total_revenue(transactions)
-    total_transactions = len(transactions)
-    avg_order_value = total_revenue / total_transactions if total_transactions else 0
+    date_range = f"{aggregate.min_date} to {aggregate.max_date}"
 
-    region_sale = json.loads(region_wise_sale(transactions))
-    top_5_prods = top_selling_products(transactions)
-    top_5_customers = json.loads(customer_analysis(transactions))
-    daily_sales = json.loads(daily_sales_trend(parse_transactions())) #Q3 TASK 2.2 (a)
-    peak_sale_days = find_peak_sales_day(parse_transactions()) #Q3 TASK 2.2 (b)
-    low_performing_prods = low_performing_products(parse_transactions(), 6) #Q3 TASK 2.3 (a)
+    total_revenue = calculate_total_revenue(aggregate)
+    total_transactions = aggregate.record_count
+    avg_order_value = divide_paise(total_revenue, total_transactions)
 
-    enriched = [t for t in enriched_transactions if t.get("API_Match")]
-    not_enriched = [t["ProductID"] for t in enriched_transactions if not t.get("API_Match")]
+    region_sale = region_wise_sale(aggregate, as_json=False)
+    top_5_prods = top_selling_products(aggregate)
+    top_5_customers = customer_analysis(aggregate, as_json=False, n=5)
+    daily_sales = daily_sales_trend(aggregate, as_json=False) #Q3 TASK 2.2 (a)
+    peak_sale_days = find_peak_sales_day(aggregate) #Q3 TASK 2.2 (b)
+    low_performing_prods = low_performing_products(aggregate, 6) #Q3 TASK 2.3 (a)
 
-    success_rate = (len(enriched) / len(enriched_transactions) * 100) if enriched_transactions else 0
+    enriched_count = aggregate.enriched_count
+    success_rate = (
+        enriched_count / aggregate.enrichment_total * 100
+    ) if aggregate.enrichment_total else 0
 
 
     with open(output_file, "w") as f:
@@ -289,6 +354,12 @@ def generate_sales_report(transactions, enriched_transactions, output_file="outp
                 f"{key:<12}{format_currency(value.get('revenue')):>15}"
                 f"{value.get('transaction_count'):>8}{value.get('unique_customers'):>10}\n"
             )
+        if aggregate.sketch:
+            bounds = aggregate.error_bounds()
+            f.write(
+                f"Customers are HyperLogLog estimates (std. error ±{bounds['unique_customers'] * 100:.2f}%); "
+                f"products bought show each customer's top {bounds['products_bought']}\n"
+            )
         f.write("\n")
 
         f.write("PEAK SALES DAYS \n")
@@ -304,16 +375,16 @@ def generate_sales_report(transactions, enriched_transactions, output_file="outp
         for r, v in region_sale.items():
             f.write(
                 f"Average Transaction Value ({r}):"
-                f"{format_currency((v.get('total_sales') / v.get('transaction_count')) / 100 if v.get('transaction_count') > 0 else 0)}\n"
+                f"{format_currency(divide_paise(v.get('total_sales'), v.get('transaction_count')))}\n"
             )
         f.write("\n")
 
         f.write("API ENRICHMENT SUMMARY\n")
         f.write("-" * 60 + "\n")
-        f.write(f"Total Products Enriched: {len(enriched)}\n")
+        f.write(f"Total Products Enriched: {enriched_count}\n")
         f.write(f"Success Rate: {success_rate:.2f}%\n")
         # f.write("Products Not Enriched: " + (", ".join(not_enriched) if not_enriched else "None") + "\n")
-        unique_not_enriched = sorted(set(not_enriched))
+        unique_not_enriched = sorted(aggregate.unmatched_products)
         f.write(
             "Products Not Enriched: " +
             (", ".join(unique_not_enriched) if unique_not_enriched else "None") +
@@ -323,35 +394,394 @@ def generate_sales_report(transactions, enriched_transactions, output_file="outp
     return
 
 
-def main():
-    # uncomment each line to run required questions
+# metric stages: name -> (function, extra args from the parsed CLI options)
+METRIC_STAGES = {
+    "revenue": (calculate_total_revenue, lambda args: ()),  # Q3 TASK 2.1 (a)
+    "regions": (region_wise_sale, lambda args: (False,)),  # Q3 TASK 2.1 (b)
+    "products": (top_selling_products, lambda args: (args.top,)),  # Q3 TASK 2.1 (c)
+    "customers": (customer_analysis, lambda args: (False,)),  # Q3 TASK 2.1 (d)
+    "daily": (daily_sales_trend, lambda args: (False,)),  # Q3 TASK 2.2 (a)
+    "peak": (find_peak_sales_day, lambda args: ()),  # Q3 TASK 2.2 (b)
+    "low-performing": (low_performing_products, lambda args: (args.threshold,)),  # Q3 TASK 2.3 (a)
+}
+# paise amounts in the regions/customers/daily results
+MONEY_KEYS = frozenset({"total_sales", "total_spent", "avg_order_value", "revenue"})
+
+
+def _format_money_keys(value):
+    if isinstance(value, dict):
+        return {
+            key: format_currency(item) if key in MONEY_KEYS else _format_money_keys(item)
+            for key, item in value.items()
+        }
+    return value
+
+def print_metric(name, result):
+    """Prints a metric stage's result with its paise amounts as currency."""
+    if name == "revenue":
+        print(format_currency(result))
+    elif name in ("products", "low-performing"):
+        print([(product, quantity, format_currency(revenue)) for product, quantity, revenue in result])
+    elif name == "peak":
+        print(result and (result[0], format_currency(result[1]), result[2]))
+    else:
+        print(json.dumps(_format_money_keys(result), indent=4, ensure_ascii=False))
+
+# every stage, in the order a run executes them
+STAGES = (
+    ["clean", "read", "parse", "validate"]
+    + list(METRIC_STAGES)
+    + ["rollup", "catalog", "batch", "enrich", "report", "stream", "incremental"]
+)
 
-    # handleQuestionOne() #Q1
-    # read_sale_data() #Q2 TASK 1.1
-    # print(parse_transactions()) #Q2 TASK 1.2
-    # print(validate_and_filter(parse_transactions(), "North", 0, 500))  # Q2 TASK 1.3
 
+def stage_name(name):
+    # validated here rather than with choices=: before Python 3.12 argparse
+    # checks the whole default list against choices and rejects a bare run
+    if name not in STAGES:
+        raise argparse.ArgumentTypeError(
+            f"invalid choice: {name!r} (choose from {', '.join(STAGES)})"
+        )
+    return name
 
-    # print(calculate_total_revenue(parse_transactions())) #Q3 TASK 2.1 (a)
-    # print(region_wise_sale(parse_transactions())) #Q3 TASK 2.1 (b)
-    # print(top_selling_products(parse_transactions(), 10)) #Q3 TASK 2.1 (c)
-    # print(customer_analysis(parse_transactions())) #Q3 TASK 2.1 (d)
 
-    # print(daily_sales_trend(parse_transactions())) #Q3 TASK 2.2 (a)
-    # print(find_peak_sales_day(parse_transactions())) #Q3 TASK 2.2 (b)
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Sales analytics pipeline")
+    parser.add_argument(
+        "stages", nargs="*", type=stage_name, metavar="STAGE", default=["report"],
+        help=f"stages to run (default: report); any of {', '.join(STAGES)}. "
+             "Stages a selection depends on (parse for the metrics, catalog "
+             "for enrich, ...) run automatically",
+    )
 
-    # print(low_performing_products(parse_transactions(), 6)) #Q3 TASK 2.3 (a)
+    paths = parser.add_argument_group("paths")
+    paths.add_argument("--input", default=SALES_FILE, help="raw sales file")
+    paths.add_argument(
+        "--batch-input",
+        help="directory (its *.txt files) or glob of raw sales files; required by the batch stage",
+    )
+    paths.add_argument("--cleaned", default=CLEANED_FILE, help="cleaned sales file")
+    paths.add_argument("--enriched", default=ENRICHED_FILE, help="enriched sales file")
+    paths.add_argument("--report", default=REPORT_FILE, help="sales report")
+    paths.add_argument(
+        "--reject-file", default=REJECT_FILE,
+        help="rows rejected by the clean/stream stages, tagged with the failing rule ('' to skip)",
+    )
+    paths.add_argument("--state-file", default=REPORT_STATE_FILE, help="incremental report state")
+    paths.add_argument("--metrics-file", help="run metrics JSON (default: next to the report)")
+    paths.add_argument(
+        "--store",
+        help="SQLite file that answers the metric and validate stages with indexed queries; "
+             "(re)loaded from the cleaned file whenever that file changes, and with "
+             "the enriched rows when the enrich stage runs without validate",
+    )
+    paths.add_argument(
+        "--columnar-dir",
+        help="directory of memory-mappable enriched columns (needs numpy): written by the "
+             "enrich stage, and answers the metric stages while the cleaned file is unchanged",
+    )
 
-    # print(fetch_all_products(1)) #Q3 TASK 3.1
-    # print(create_product_mapping(fetch_all_products(1)))
-    # print(enrich_sales_data(parse_transactions(), create_product_mapping(fetch_all_products(100))))
-    generate_sales_report(
-        parse_transactions(),
-        json.loads(enrich_sales_data(
-            parse_transactions(), create_product_mapping(fetch_all_products(100))
-        )),
+    filters = parser.add_argument_group("filters (validate_and_filter)")
+    filters.add_argument("--region")
+    filters.add_argument("--min-amount", type=float)
+    filters.add_argument("--max-amount", type=float)
+
+    analysis = parser.add_argument_group("analysis")
+    analysis.add_argument("--top", type=int, default=5, help="products listed by the products stage")
+    analysis.add_argument("--threshold", type=int, default=10, help="low-performing quantity threshold")
+    analysis.add_argument(
+        "--period", choices=("day", "week", "month", "quarter"), default="month",
+        help="time bucket of the rollup stage",
+    )
+    analysis.add_argument(
+        "--by", nargs="+", choices=("period", "region", "product", "segment"), default=["period"],
+        help="rollup stage breakdown, e.g. --by region product period",
+    )
+    analysis.add_argument("--compact", action="store_true", help="parse into compact Transaction records")
+    analysis.add_argument("--sketch", action="store_true", help="approximate distinct counts in reports")
+
+    catalog = parser.add_argument_group("product catalog")
+    catalog.add_argument("--catalog-size", type=int, default=100)
+    catalog.add_argument("--base-url", help="catalog API root (default: dummyjson.com)")
+    catalog.add_argument("--cache-dir", help="catalog cache directory")
+    catalog.add_argument("--cache-ttl", type=int, help="seconds a cached catalog stays fresh")
+    catalog.add_argument("--refresh-cache", action="store_true", help="revalidate the cached catalog first")
+    catalog.add_argument("--no-cache", action="store_true", help="fetch the catalog pages live")
+
+    runtime = parser.add_argument_group("runtime")
+    runtime.add_argument(
+        "--workers", type=int,
+        help="processes for the clean (default 1) and batch (default: all cores) stages "
+             "and threads for catalog fetches (default 8)",
+    )
+    runtime.add_argument(
+        "--sequential", action="store_true",
+        help="fetch the catalog when its stage comes up instead of in the background",
     )
+    runtime.add_argument(
+        "--parse-cache-dir",
+        help="keep parsed cleaned files here between runs (keyed by content hash)",
+    )
+    runtime.add_argument("--trace-memory", action="store_true", help="record tracemalloc peaks per stage")
+    runtime.add_argument("--profile-dir", help="write a cProfile dump per stage here")
+    return parser
+
+
+def resolve_stages(selected, args):
+    """Adds the stages the selected ones depend on; returns them in run order."""
+    stages = set(selected)
+    if stages & {"report", "enrich"}:
+        stages.update({"parse", "enrich", "catalog"})
+    # metrics read parsed rows unless --store or a current --columnar-dir answers them
+    answered = args.store or columns_current(args, stages)
+    if stages & set(METRIC_STAGES) and not answered or "rollup" in stages:
+        stages.add("parse")
+    if stages & {"stream", "incremental", "batch"} and "catalog" not in stages:
+        stages.add("catalog")
+    if ("parse" in stages or args.store and stages & set(METRIC_STAGES)) and any(
+        value is not None for value in (args.region, args.min_amount, args.max_amount)
+    ):
+        stages.add("validate")
+    if "validate" in stages and not args.store:
+        stages.add("parse")
+    return [name for name in STAGES if name in stages]
+
+
+def columns_current(args, stages):
+    """Whether --columnar-dir holds the enriched form of the cleaned file as it stands."""
+    if not args.columnar_dir or "clean" in stages:
+        return False
+    from utils.columnar import enriched_columns_current
+
+    return enriched_columns_current(args.columnar_dir, args.cleaned)
+
+
+def load_catalog(args):
+    from utils.api_handler import fetch_products_paginated, load_product_mapping
+
+    base_url = {"base_url": args.base_url} if args.base_url else {}
+    if args.no_cache:
+        return fetch_products_paginated(
+            total=args.catalog_size, max_workers=args.workers or 8, **base_url
+        )
 
-if __name__ == "__main__":
-    main()
+    from utils.catalog_cache import CatalogCache
+
+    options = {}
+    if args.cache_dir:
+        options["cache_dir"] = args.cache_dir
+    if args.cache_ttl is not None:
+        options["ttl"] = args.cache_ttl
+    if args.refresh_cache:
+        options["ttl"] = options["stale_ttl"] = 0
+    return load_product_mapping(
+        args.catalog_size, cache=CatalogCache(**options), max_workers=args.workers or 8, **base_url
+    )
 
+
+def start_catalog_fetch(args):
+    """
+    Runs load_catalog(args) on a daemon thread; returns its Future. A run
+    that ends before the catalog stage (e.g. an early error) exits without
+    waiting for the download.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(load_catalog(args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="catalog-fetch", daemon=True).start()
+    return future
+
+
+def parse_cache(args):
+    return ParseCache(cache_dir=args.parse_cache_dir) if args.parse_cache_dir else PARSE_CACHE
+
+
+def open_store(args):
+    from utils.sales_store import open_sales_store
+
+    with stage("open_sales_store"):
+        return open_sales_store(
+            args.store, args.cleaned,
+            lambda path: iter_mmap_transactions(path, clean=False, compact=True),
+        )
+
+
+def run_stages(stages, args):
+    state = {}
+    catalog = None
+    if "catalog" in stages and not args.sequential:
+        # the catalog downloads while the file stages run; only the catalog
+        # stage (just before enrich/stream/incremental) waits for it
+        catalog = start_catalog_fetch(args)
+    for name in stages:
+        if name == "clean":
+            if args.workers and args.workers > 1:
+                from utils.parallel_ingest import parallel_clean_and_parse
+
+                # rows are parsed in the workers only when a later stage reads them
+                transactions, counters = parallel_clean_and_parse(
+                    args.input, args.cleaned, workers=args.workers, compact=args.compact,
+                    reject_file=args.reject_file, parse="parse" in stages,
+                )
+                if transactions is not None:
+                    state["transactions"] = transactions
+                print(f"Total records passed: {counters['total']}")
+                print(f"Invalid records removed: {counters['invalid']}")
+                print(f"Valid records after cleaning: {counters['total'] - counters['invalid']}")
+                print_rejects(counters)
+            else:
+                handleQuestionOne(args.input, args.cleaned, args.reject_file)
+        elif name == "read":
+            read_sale_data(args.cleaned)
+        elif name == "parse":
+            if "transactions" not in state:
+                state["transactions"] = parse_transactions(args.compact, args.cleaned, parse_cache(args))
+            if state["transactions"] is None:
+                return 1
+        elif name == "validate":
+            if "transactions" in state:
+                source = state["transactions"]
+                if any(value is not None for value in (args.region, args.min_amount, args.max_amount)):
+                    # filtered queries go through the index, memoized with the
+                    # parsed file: later queries on it are bisects, not scans
+                    if "index" not in state:
+                        with stage("transaction_index"):
+                            state["index"] = parse_cache(args).get(
+                                args.cleaned, lambda path: TransactionIndex(source),
+                                "index.compact" if args.compact else "index",
+                            ).bind(source)
+                    source = state["index"]
+                state["transactions"], _, filter_summary = validate_and_filter(
+                    source, args.region, args.min_amount, args.max_amount
+                )
+            else:
+                from utils import sales_store
+
+                if "store" not in state:
+                    state["store"] = open_store(args)
+                with stage("sales_store.validate_and_filter"):
+                    state["transactions"], _, filter_summary = sales_store.validate_and_filter(
+                        state["store"], args.region, args.min_amount, args.max_amount
+                    )
+            print(json.dumps(filter_summary, indent=4))
+        elif name in METRIC_STAGES and "transactions" not in state and args.store:
+            # --store without parsed rows: the metric is an indexed query
+            from utils import sales_store
+
+            if "store" not in state:
+                state["store"] = open_store(args)
+            fn, extra_args = METRIC_STAGES[name]
+            with stage(f"sales_store.{fn.__name__}"):
+                result = getattr(sales_store, fn.__name__)(state["store"], *extra_args(args))
+            print_metric(name, result)
+        elif name in METRIC_STAGES and "transactions" not in state:
+            # current --columnar-dir: vectorized metrics over the mapped columns
+            from utils import columnar
+
+            if "columns" not in state:
+                with stage("load_enriched_columns"):
+                    state["columns"] = columnar.load_enriched_columns(args.columnar_dir).to_store()
+            fn, extra_args = METRIC_STAGES[name]
+            with stage(f"columnar.{fn.__name__}"):
+                result = getattr(columnar, fn.__name__)(state["columns"], *extra_args(args))
+            print_metric(name, result)
+        elif name in METRIC_STAGES:
+            if "aggregate" not in state:
+                # one scan shared by every selected metric
+                state["aggregate"] = aggregate_sales(state["transactions"], sketch=args.sketch)
+            fn, extra_args = METRIC_STAGES[name]
+            print_metric(name, fn(state["aggregate"], *extra_args(args)))
+        elif name == "rollup":
+            from utils.rollups import build_sales_cube, customer_segments
+
+            segments = customer_segments(state.get("aggregate") or state["transactions"])
+            cube = build_sales_cube(state["transactions"], segments)
+            print(f"{' x '.join(args.by):<48}{'Revenue':>18}{'Qty':>8}{'Txns':>8}")
+            for key, stats in cube.rollup(args.by, args.period).items():
+                label = " | ".join(key) if isinstance(key, tuple) else key
+                print(
+                    f"{truncate(label, 47):<48}{format_currency(stats['revenue']):>18}"
+                    f"{stats['quantity']:>8}{stats['transaction_count']:>8}"
+                )
+        elif name == "catalog":
+            if catalog is None:
+                state["product_mapping"] = load_catalog(args)
+            else:
+                with stage("catalog_wait"):
+                    state["product_mapping"] = catalog.result()
+        elif name == "batch":
+            from utils.parallel_ingest import aggregate_files
+
+            aggregate, counters = aggregate_files(
+                args.batch_input, args.workers, state["product_mapping"], args.sketch
+            )
+            print(
+                f"{counters['files']} files: {counters['total']} records, "
+                f"{counters['invalid']} invalid removed"
+            )
+            print_rejects(counters)
+            write_sales_report(aggregate, args.report)
+            print(f"Report written to {args.report}")
+        elif name == "enrich":
+            from utils.api_handler import enrich_sales_data
+
+            # the columns stand for the cleaned file only when no filter ran first
+            state["enriched"] = enrich_sales_data(
+                state["transactions"], state["product_mapping"], columns_dir=args.columnar_dir,
+                enriched_file=args.enriched,
+                source_file=args.cleaned if "validate" not in stages else None,
+            )
+            if args.store and "validate" not in stages:
+                # every row of the cleaned file, enriched: fill the store's API_* columns
+                from utils.sales_store import SalesStore, store_enriched
+
+                with stage("sales_store.store_enriched"):
+                    state["store"] = store_enriched(
+                        state.get("store") or SalesStore(args.store), args.cleaned, state["enriched"]
+                    )
+        elif name == "report":
+            generate_sales_report(
+                state["transactions"], state["enriched"], args.report, sketch=args.sketch
+            )
+            print(f"Report written to {args.report}")
+        elif name == "stream":
+            print(stream_sales_report(
+                args.input, args.report, state["product_mapping"],
+                args.region, args.min_amount, args.max_amount, args.enriched, args.sketch,
+                args.reject_file,
+            ))
+        elif name == "incremental":
+            incremental_sales_report(args.cleaned, args.report, args.state_file, state["product_mapping"])
+    return 0
+
+
+def main(argv=None):
+    """
+    e.g. python main.py                      clean file -> parse -> enrich -> report
+         python main.py clean                Q1 only
+         python main.py revenue regions      selected metrics over the cleaned file
+         python main.py rollup --period week --by region period
+         python main.py validate --region North --min-amount 0 --max-amount 500
+         python main.py stream --no-cache --workers 8
+         python main.py batch --batch-input "drops/2024-12-*/store-*.txt"
+         python main.py revenue daily --store Output/sales.sqlite3
+    """
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    stages = resolve_stages(args.stages, args)
+    if "batch" in stages and not args.batch_input:
+        parser.error("the batch stage needs --batch-input")
+    metrics_file = args.metrics_file or metrics_path_for(args.report)
+    # per-stage timings, rows, API latency and logged errors go to metrics_file
+    with collect_metrics(metrics_file, args.trace_memory, args.profile_dir):
+        return run_stages(stages, args)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,228 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from tools.fake_catalog_server import make_server
+from utils.api_handler import fetch_catalog_pages, fetch_product_page, fetch_products_cached
+from utils.catalog_cache import CatalogCache
+
+
+class CatalogServerTest(unittest.TestCase):
+    """Runs tools/fake_catalog_server.py on a free port for each test."""
+
+    products = 250
+    fail_every = 0
+    fail_skips = ()
+    delay = 0
+
+    def setUp(self):
+        self.server = make_server(
+            product_count=self.products, fail_every=self.fail_every, delay=self.delay,
+            fail_skips=self.fail_skips,
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/"
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = tmp.name
+        if not self.delay:
+            # retries back off with time.sleep (the server's delay does too);
+            # keep the failure cases fast
+            patcher = mock.patch("utils.api_handler.time.sleep")
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @property
+    def requests_served(self):
+        return self.server.RequestHandlerClass.requests_served
+
+    def cache(self, **options):
+        return CatalogCache(cache_dir=self.cache_dir, **options)
+
+    def go_offline(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fetch(self, cache, n=None):
+        return fetch_products_cached(n or self.products, self.base_url, cache, page_size=100)
+
+    def entry_key(self):
+        (name,) = os.listdir(self.cache_dir)
+        return name[:-len(".json")]
+
+    def age_entry(self, cache, seconds):
+        key = self.entry_key()
+        cache.put(key, dict(cache.get(key), fetched_at=time.time() - seconds))
+        return key
+
+    def join_refreshes(self):
+        for thread in threading.enumerate():
+            if thread.name.startswith("catalog-refresh-"):
+                thread.join(timeout=30)
+
+
+class PaginatedFetchTest(CatalogServerTest):
+    def test_fetches_every_page(self):
+        mapping, pages, complete = fetch_catalog_pages(page_size=100, base_url=self.base_url)
+        self.assertTrue(complete)
+        self.assertEqual(sorted(mapping), list(range(1, self.products + 1)))
+        self.assertEqual(sorted(pages, key=int), ["0", "100", "200"])
+
+    def test_zero_total_makes_no_request(self):
+        mapping, pages, complete = fetch_catalog_pages(total=0, base_url=self.base_url)
+        self.assertEqual((mapping, pages, complete), ({}, {}, True))
+        self.assertEqual(fetch_products_cached(0, self.base_url, self.cache()), [])
+        self.assertEqual(self.requests_served, 0)
+
+    def test_304_without_cached_copy_is_refetched(self):
+        class NotModifiedOnce:
+            def __init__(self, session):
+                self.session = session
+                self.calls = []
+
+            def get(self, url, headers=None, timeout=None):
+                self.calls.append(headers)
+                response = self.session.get(url, headers=headers, timeout=timeout)
+                if len(self.calls) == 1:
+                    response.status_code = 304
+                return response
+
+        with requests.Session() as session:
+            stub = NotModifiedOnce(session)
+            page = fetch_product_page(stub, 0, 10, self.base_url, retries=0)
+        self.assertEqual(len(page["products"]), 10)
+        self.assertEqual(len(stub.calls), 2)
+
+    def test_unchanged_pages_come_back_as_304(self):
+        _, cached_pages, _ = fetch_catalog_pages(page_size=100, base_url=self.base_url)
+        mapping, pages, complete = fetch_catalog_pages(
+            page_size=100, base_url=self.base_url, cached_pages=cached_pages
+        )
+        self.assertTrue(complete)
+        self.assertEqual(len(mapping), self.products)
+        for skip, page in pages.items():
+            # a 304 hands back the cached page object itself
+            self.assertIs(page, cached_pages[skip])
+
+
+class FailingPageTest(CatalogServerTest):
+    fail_skips = (100,)
+
+    def test_partial_fetch_is_not_cached(self):
+        mapping, pages, complete = fetch_catalog_pages(
+            page_size=100, base_url=self.base_url, retries=1, backoff=0
+        )
+        self.assertFalse(complete)
+        self.assertEqual(sorted(pages, key=int), ["0", "200"])
+        self.assertEqual(len(mapping), 150)
+
+        products = self.fetch(self.cache())
+        self.assertEqual(len(products), 150)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+class CachedFetchTest(CatalogServerTest):
+    def test_fresh_entry_skips_the_network(self):
+        cache = self.cache()
+        first = self.fetch(cache)
+        served = self.requests_served
+        self.assertEqual(self.fetch(cache), first)
+        self.assertEqual(self.requests_served, served)
+
+    def test_stale_entry_is_served_and_refreshed_in_background(self):
+        cache = self.cache()
+        first = self.fetch(cache)
+        key = self.age_entry(cache, cache.ttl + 1)
+        stamped = cache.get(key)["fetched_at"]
+        self.assertEqual(cache.freshness(cache.get(key)), "stale")
+
+        self.assertEqual(self.fetch(cache), first)
+        self.join_refreshes()
+        self.assertGreater(cache.get(key)["fetched_at"], stamped)
+        self.assertEqual(cache.freshness(cache.get(key)), "fresh")
+
+    def test_expired_entry_is_refreshed_first(self):
+        cache = self.cache()
+        first = self.fetch(cache)
+        key = self.age_entry(cache, cache.ttl + cache.stale_ttl + 60)
+        served = self.requests_served
+
+        self.assertEqual(self.fetch(cache), first)
+        self.assertEqual(self.requests_served, served + 3)
+        self.assertEqual(cache.freshness(cache.get(key)), "fresh")
+
+    def test_revalidation_restamps_the_entry(self):
+        # ttl 0: every fetch after the first revalidates with If-None-Match
+        cache = self.cache(ttl=0, stale_ttl=0)
+        first = self.fetch(cache)
+        key = self.entry_key()
+        stamped = cache.get(key)["fetched_at"]
+        etags = {skip: page["etag"] for skip, page in cache.get(key)["pages"].items()}
+
+        self.assertEqual(self.fetch(cache), first)
+        entry = cache.get(key)
+        self.assertGreater(entry["fetched_at"], stamped)
+        self.assertEqual({skip: page["etag"] for skip, page in entry["pages"].items()}, etags)
+
+    def test_offline_serves_a_stale_entry(self):
+        cache = self.cache()
+        first = self.fetch(cache)
+        key = self.age_entry(cache, cache.ttl + 1)
+        stamped = cache.get(key)["fetched_at"]
+
+        self.go_offline()
+        self.assertEqual(self.fetch(cache), first)
+        self.join_refreshes()
+        self.assertEqual(cache.get(key)["fetched_at"], stamped)
+
+    def test_offline_keeps_an_expired_entry_expired(self):
+        cache = self.cache()
+        first = self.fetch(cache)
+        key = self.age_entry(cache, cache.ttl + cache.stale_ttl + 60)
+        stamped = cache.get(key)["fetched_at"]
+
+        self.go_offline()
+        self.assertEqual(self.fetch(cache), first)
+        self.assertEqual(cache.freshness(cache.get(key)), "expired")
+        self.assertEqual(cache.get(key)["fetched_at"], stamped)
+
+    def test_offline_without_a_cache_returns_nothing(self):
+        self.go_offline()
+        self.assertEqual(self.fetch(self.cache()), [])
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+class SlowCatalogTest(CatalogServerTest):
+    delay = 10
+
+    def test_early_exit_does_not_wait_for_the_catalog(self):
+        # parse fails before the catalog stage; the background fetch must not hold the exit
+        start = time.perf_counter()
+        result = subprocess.run(
+            [
+                sys.executable, "main.py", "parse", "catalog", "--no-cache",
+                "--cleaned", os.path.join(self.cache_dir, "missing.txt"),
+                "--base-url", self.base_url,
+                "--metrics-file", os.path.join(self.cache_dir, "metrics.json"),
+            ],
+            cwd=REPO_ROOT, capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(result.returncode, 1)
+        self.assertLess(time.perf_counter() - start, self.delay)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+class ArgParserTest(unittest.TestCase):
+    def parse(self, argv):
+        return main.build_arg_parser().parse_args(argv)
+
+    def test_no_arguments_runs_the_report(self):
+        args = self.parse([])
+        self.assertEqual(args.stages, ["report"])
+        self.assertEqual(
+            main.resolve_stages(args.stages, args), ["parse", "catalog", "enrich", "report"]
+        )
+
+    def test_selected_stages(self):
+        self.assertEqual(self.parse(["clean", "revenue"]).stages, ["clean", "revenue"])
+
+    def test_unknown_stage_is_rejected(self):
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit):
+                self.parse(["bogus"])
+        self.assertIn("invalid choice: 'bogus'", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Local stand-in for the dummyjson products API, for exercising the catalog
+fetch/cache code without the network.
+
+Serves GET /products?limit=&skip= with ETag/If-None-Match support. It can
+also fail every Nth request with a 503 to exercise retries, always fail the
+pages at given skip offsets (a page that never recovers), and hold every
+response for --delay seconds to stand in for a slow network.
+
+Usage: python tools/fake_catalog_server.py [--port 8765] [--products 100] [--fail-every N]
+       [--fail-skip SKIP ...] [--delay SECONDS]
+Then point the fetchers at base_url="http://127.0.0.1:8765/".
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CATEGORIES = ("laptops", "smartphones", "mobile-accessories", "tablets")
+
+
+def fake_products(count):
+    return [
+        {
+            "id": i,
+            "title": f"Product {i}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "brand": f"Brand {i % 7}",
+            "price": round(9.99 + i, 2),
+            "rating": round(1 + (i * 37 % 400) / 100, 2),
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def make_handler(products, fail_every=0, delay=0, fail_skips=()):
+    counter_lock = threading.Lock()
+
+    class CatalogHandler(BaseHTTPRequestHandler):
+        requests_served = 0
+
+        def do_GET(self):
+            if delay:
+                time.sleep(delay)
+            url = urlparse(self.path)
+            if url.path.rstrip("/") != "/products":
+                self.send_error(404)
+                return
+            with counter_lock:
+                type(self).requests_served += 1
+                served = type(self).requests_served
+            if fail_every and served % fail_every == 0:
+                self.send_error(503)
+                return
+
+            query = parse_qs(url.query)
+            limit = int(query.get("limit", ["30"])[0])
+            skip = int(query.get("skip", ["0"])[0])
+            if skip in fail_skips:
+                self.send_error(503)
+                return
+            page = products[skip:skip + limit] if limit else products[skip:]
+            body = json.dumps({
+                "products": page, "total": len(products), "skip": skip, "limit": len(page),
+            }).encode("utf-8")
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return CatalogHandler
+
+
+def make_server(port=0, product_count=100, fail_every=0, delay=0, fail_skips=()):
+    """Builds (without starting) a server; port 0 picks a free port."""
+    handler = make_handler(fake_products(product_count), fail_every, delay, frozenset(fail_skips))
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--fail-skip", type=int, nargs="*", default=[])
+    parser.add_argument("--delay", type=float, default=0)
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.products, args.fail_every, args.delay, args.fail_skip)
+    print(f"Serving {args.products} fake products on http://127.0.0.1:{server.server_port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
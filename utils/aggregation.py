@@ -0,0 +1,329 @@
+from utils.sketches import DEFAULT_HLL_PRECISION, DEFAULT_TOP_K, HyperLogLog, SpaceSaving
+
+REGIONS = ("North", "South", "West", "East")
+
+
+class SalesAggregate:
+    """
+    Accumulates every report metric in a single scan over parsed transactions.
+
+    The metric functions in data_processor are views over these accumulators,
+    so a report costs one pass no matter how many metrics it shows.
+
+    With sketch=True the unique-customer sets (per day and per region) become
+    HyperLogLog counters and each customer's products_bought keeps only a
+    bounded top-k, trading exactness for memory that no longer grows with
+    the number of customers. Up to k products a customer keeps a plain
+    product -> count dict (exact, first-purchase order like exact mode);
+    only a customer who buys more distinct products is switched to a
+    SpaceSaving summary. error_bounds() describes the error.
+    """
+
+    def __init__(self, sketch=False, hll_precision=DEFAULT_HLL_PRECISION,
+                 products_per_customer=DEFAULT_TOP_K):
+        self.sketch = sketch
+        self.hll_precision = hll_precision
+        self.products_per_customer = products_per_customer
+        self.record_count = 0
+        self.total_revenue = 0
+        self.min_date = None
+        self.max_date = None
+        # region -> {"transaction_count", "total_sales"}; fixed regions first
+        # so ties keep the report's historical ordering. Money is int paise.
+        self.regions = {
+            region: {"transaction_count": 0, "total_sales": 0} for region in REGIONS
+        }
+        # product name -> [total_quantity, total_revenue]
+        self.products = {}
+        # customer id -> {"total_spent", "purchase_count", "products_bought"}
+        self.customers = {}
+        # date -> {"revenue", "transaction_count", "unique_customers"}
+        self.daily = {}
+        # region -> distinct customer ids (set, or HyperLogLog in sketch mode)
+        self.region_customers = {}
+        # API enrichment summary, fed through add_enrichment
+        self.enrichment_total = 0
+        self.enriched_count = 0
+        self.unmatched_products = set()
+
+    def _new_distinct(self):
+        return HyperLogLog(self.hll_precision) if self.sketch else set()
+
+    def _new_products_bought(self):
+        # product -> None (exact) or product -> count (sketch, up to k products)
+        return {}
+
+    def _count_product(self, stats, product):
+        """Sketch mode: exact counts up to k distinct products, then SpaceSaving."""
+        bought = stats["products_bought"]
+        if type(bought) is dict:
+            count = bought.get(product)
+            if count is not None:
+                bought[product] = count + 1
+                return
+            if len(bought) < self.products_per_customer:
+                bought[product] = 1
+                return
+            bought = stats["products_bought"] = SpaceSaving.from_counts(bought, self.products_per_customer)
+        bought.add(product)
+
+    def _merge_products(self, target, source):
+        k = self.products_per_customer
+        if type(target) is dict and type(source) is dict:
+            for product, count in source.items():
+                target[product] = target.get(product, 0) + count
+            return target if len(target) <= k else SpaceSaving.from_counts(target, k)
+        if type(target) is dict:
+            target = SpaceSaving.from_counts(target, k)
+        if type(source) is dict:
+            source = SpaceSaving.from_counts(source, k)
+        return target.merge(source)
+
+    def error_bounds(self):
+        """Relative standard error of distinct counts and products_bought limit."""
+        if not self.sketch:
+            return {"unique_customers": 0.0, "products_bought": None}
+        return {
+            "unique_customers": HyperLogLog(self.hll_precision).relative_error,
+            "products_bought": self.products_per_customer,
+        }
+
+    def add(self, txn):
+        quantity = txn.get("Quantity", 0)
+        unit_price = txn.get("UnitPrice", 0)
+        amount = quantity * unit_price
+
+        self.record_count += 1
+        self.total_revenue += amount
+
+        date = txn.get("Date")
+        if date is not None:
+            if self.min_date is None or date < self.min_date:
+                self.min_date = date
+            if self.max_date is None or date > self.max_date:
+                self.max_date = date
+
+        region = txn.get("Region")
+        if region:
+            stats = self.regions.get(region)
+            if stats is None:
+                stats = self.regions[region] = {"transaction_count": 0, "total_sales": 0}
+            stats["transaction_count"] += 1
+            stats["total_sales"] += amount
+
+        customer_id = (txn.get("CustomerID") or "").strip()
+        if region and customer_id:
+            customers = self.region_customers.get(region)
+            if customers is None:
+                customers = self.region_customers[region] = self._new_distinct()
+            customers.add(customer_id)
+
+        product = (txn.get("ProductName") or "").strip()
+        if product:
+            stats = self.products.get(product)
+            if stats is None:
+                stats = self.products[product] = [0, 0]
+            stats[0] += quantity
+            stats[1] += amount
+
+        if customer_id:
+            stats = self.customers.get(customer_id)
+            if stats is None:
+                stats = self.customers[customer_id] = {
+                    "total_spent": 0,
+                    "purchase_count": 0,
+                    "products_bought": self._new_products_bought(),
+                }
+            stats["total_spent"] += amount
+            stats["purchase_count"] += 1
+            if product:
+                if self.sketch:
+                    self._count_product(stats, product)
+                else:
+                    stats["products_bought"][product] = None
+
+        day = (date or "").strip()
+        if day:
+            stats = self.daily.get(day)
+            if stats is None:
+                stats = self.daily[day] = {
+                    "revenue": 0,
+                    "transaction_count": 0,
+                    "unique_customers": self._new_distinct(),
+                }
+            stats["revenue"] += amount
+            stats["transaction_count"] += 1
+            if customer_id:
+                stats["unique_customers"].add(customer_id)
+
+    def add_enrichment(self, txn, enrichment=None):
+        """Counts one enriched row; pass the catalog entry separately to skip the row view."""
+        self.enrichment_total += 1
+        if (txn if enrichment is None else enrichment).get("API_Match"):
+            self.enriched_count += 1
+        else:
+            self.unmatched_products.add(txn["ProductID"])
+
+    def update(self, transactions):
+        add = self.add
+        for txn in transactions:
+            add(txn)
+        return self
+
+    def _merge_distinct(self, target, source):
+        if target is None:
+            target = self._new_distinct()
+        if self.sketch:
+            target.merge(source)
+        else:
+            target.update(source)
+        return target
+
+    def merge(self, other):
+        """
+        Folds another aggregate (e.g. of a different file) into this one.
+
+        Every accumulator is a sum, a min/max, a union or a keyed map of
+        those, so merging partial aggregates in file order gives the same
+        metrics as aggregating the concatenated rows; keys first seen in
+        other are appended after this aggregate's own.
+        """
+        if other.sketch != self.sketch:
+            raise ValueError("Cannot merge exact and sketch-mode aggregates")
+
+        self.record_count += other.record_count
+        self.total_revenue += other.total_revenue
+        if other.min_date is not None and (self.min_date is None or other.min_date < self.min_date):
+            self.min_date = other.min_date
+        if other.max_date is not None and (self.max_date is None or other.max_date > self.max_date):
+            self.max_date = other.max_date
+
+        for region, stats in other.regions.items():
+            target = self.regions.get(region)
+            if target is None:
+                target = self.regions[region] = {"transaction_count": 0, "total_sales": 0}
+            target["transaction_count"] += stats["transaction_count"]
+            target["total_sales"] += stats["total_sales"]
+
+        for region, customers in other.region_customers.items():
+            self.region_customers[region] = self._merge_distinct(
+                self.region_customers.get(region), customers
+            )
+
+        for product, (quantity, revenue) in other.products.items():
+            target = self.products.get(product)
+            if target is None:
+                target = self.products[product] = [0, 0]
+            target[0] += quantity
+            target[1] += revenue
+
+        for customer_id, stats in other.customers.items():
+            target = self.customers.get(customer_id)
+            if target is None:
+                target = self.customers[customer_id] = {
+                    "total_spent": 0,
+                    "purchase_count": 0,
+                    "products_bought": self._new_products_bought(),
+                }
+            target["total_spent"] += stats["total_spent"]
+            target["purchase_count"] += stats["purchase_count"]
+            if self.sketch:
+                target["products_bought"] = self._merge_products(
+                    target["products_bought"], stats["products_bought"]
+                )
+            else:
+                target["products_bought"].update(dict.fromkeys(stats["products_bought"]))
+
+        for day, stats in other.daily.items():
+            target = self.daily.get(day)
+            if target is None:
+                target = self.daily[day] = {
+                    "revenue": 0,
+                    "transaction_count": 0,
+                    "unique_customers": self._new_distinct(),
+                }
+            target["revenue"] += stats["revenue"]
+            target["transaction_count"] += stats["transaction_count"]
+            self._merge_distinct(target["unique_customers"], stats["unique_customers"])
+
+        self.enrichment_total += other.enrichment_total
+        self.enriched_count += other.enriched_count
+        self.unmatched_products |= other.unmatched_products
+        return self
+
+    def _distinct_state(self, customers):
+        return customers.to_state() if self.sketch else sorted(customers)
+
+    def _distinct_from_state(self, state):
+        return HyperLogLog.from_state(state) if self.sketch else set(state)
+
+    def _products_state(self, products):
+        if not self.sketch:
+            return list(products)
+        if type(products) is dict:
+            return [[product, count] for product, count in products.items()]
+        return products.to_state()
+
+    def _products_from_state(self, state):
+        if not self.sketch:
+            return dict.fromkeys(state)
+        if isinstance(state, dict):
+            return SpaceSaving.from_state(state)
+        return {product: count for product, count in state}
+
+    def to_state(self):
+        """JSON-compatible snapshot of every accumulator (see from_state)."""
+        return {
+            "sketch": self.sketch,
+            "hll_precision": self.hll_precision,
+            "products_per_customer": self.products_per_customer,
+            "record_count": self.record_count,
+            "total_revenue": self.total_revenue,
+            "min_date": self.min_date,
+            "max_date": self.max_date,
+            "regions": self.regions,
+            "region_customers": {
+                region: self._distinct_state(customers)
+                for region, customers in self.region_customers.items()
+            },
+            "products": self.products,
+            "customers": {
+                customer_id: dict(stats, products_bought=self._products_state(stats["products_bought"]))
+                for customer_id, stats in self.customers.items()
+            },
+            "daily": {
+                date: dict(stats, unique_customers=self._distinct_state(stats["unique_customers"]))
+                for date, stats in self.daily.items()
+            },
+            "enrichment_total": self.enrichment_total,
+            "enriched_count": self.enriched_count,
+            "unmatched_products": sorted(self.unmatched_products),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        aggregate = cls(state["sketch"], state["hll_precision"], state["products_per_customer"])
+        aggregate.record_count = state["record_count"]
+        aggregate.total_revenue = state["total_revenue"]
+        aggregate.min_date = state["min_date"]
+        aggregate.max_date = state["max_date"]
+        aggregate.regions = state["regions"]
+        aggregate.region_customers = {
+            region: aggregate._distinct_from_state(customers)
+            for region, customers in state["region_customers"].items()
+        }
+        aggregate.products = state["products"]
+        aggregate.customers = {
+            customer_id: dict(
+                stats, products_bought=aggregate._products_from_state(stats["products_bought"])
+            )
+            for customer_id, stats in state["customers"].items()
+        }
+        aggregate.daily = {
+            date: dict(stats, unique_customers=aggregate._distinct_from_state(stats["unique_customers"]))
+            for date, stats in state["daily"].items()
+        }
+        aggregate.enrichment_total = state["enrichment_total"]
+        aggregate.enriched_count = state["enriched_count"]
+        aggregate.unmatched_products = set(state["unmatched_products"])
+        return aggregate
@@ -1,8 +1,26 @@
 import requests
 import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from operator import attrgetter
+from types import MappingProxyType
 from urllib.parse import urlencode, urlunparse, urlparse
 
+from utils.catalog_cache import CatalogCache
+from utils.columnar import save_enriched_columns
+from utils.metrics import count, instrumented, record_api_call
+from utils.money import paise_to_text
+from utils.transactions import (
+    ENRICHMENT_FIELDS,
+    TRANSACTION_FIELDS,
+    EnrichedBatch,
+    EnrichedRow,
+    Transaction,
+    as_batch,
+)
+
 BASE_URL = "https://dummyjson.com/"
 
 # helper function
@@ -12,111 +30,408 @@ def build_url(base_url, path, args_dict):
     url_parts[4] = urlencode(args_dict)
     return urlunparse(url_parts)
 
-def save_enriched_data(enriched_transactions, filename="data/enriched_sales_data.txt"):
+ENRICHED_HEADERS = TRANSACTION_FIELDS + ENRICHMENT_FIELDS
+
+_transaction_fields = attrgetter(*TRANSACTION_FIELDS)
+
+
+def _base_text(tx):
+    """Pipe-joined TRANSACTION_FIELDS of a base record."""
+    if type(tx) is Transaction:
+        transaction_id, date, product_id, name, quantity, unit_price, customer_id, region = (
+            _transaction_fields(tx)
+        )
+    else:
+        get = tx.get
+        transaction_id, date, product_id, name = (
+            get("TransactionID", ""), get("Date", ""), get("ProductID", ""), get("ProductName", "")
+        )
+        quantity, unit_price = get("Quantity", ""), get("UnitPrice", 0)
+        customer_id, region = get("CustomerID", ""), get("Region", "")
+    return (
+        f"{transaction_id}|{date}|{product_id}|{name}|{quantity}|"
+        f"{paise_to_text(unit_price)}|{customer_id}|{region}"
+    )
+
+def _enrichment_text(enrichment):
+    return "|".join(str(enrichment.get(name, "")) for name in ENRICHMENT_FIELDS)
+
+def _enriched_writer(f):
+    """
+    write(base record, enrichment) for one open file; the enrichment columns
+    of each catalog entry are formatted once and reused for every row
+    sharing it.
+    """
+    suffixes = {}
+
+    def write(base, enrichment):
+        cached = suffixes.get(id(enrichment))
+        if cached is None or cached[0] is not enrichment:
+            cached = suffixes[id(enrichment)] = (enrichment, _enrichment_text(enrichment))
+        f.write(f"{_base_text(base)}|{cached[1]}\n")
+
+    f.write("|".join(ENRICHED_HEADERS) + "\n")
+    return write
+
+def _enriched_pairs(rows):
+    for row in rows:
+        if type(row) is EnrichedRow:
+            yield row.transaction, row.enrichment
+        else:
+            yield row, row
+
+def iter_save_enriched_data(enriched_transactions, filename="Data/enriched_sales_data.txt"):
+    """
+    Writes enriched transactions to filename as they stream through and
+    yields each one on, so the file can be produced without a full batch.
+    """
+    with open(filename, "w") as f:
+        write = _enriched_writer(f)
+        for tx in enriched_transactions:
+            if type(tx) is EnrichedRow:
+                write(tx.transaction, tx.enrichment)
+            else:
+                write(tx, tx)
+            yield tx
+
+@instrumented()
+def save_enriched_data(enriched_transactions, filename="Data/enriched_sales_data.txt"):
     if not enriched_transactions:
         return
 
-    headers = [
-        "TransactionID", "Date", "ProductID", "ProductName",
-        "Quantity", "UnitPrice", "CustomerID", "Region",
-        "API_Category", "API_Brand", "API_Rating", "API_Match"
-    ]
-
+    if isinstance(enriched_transactions, EnrichedBatch):
+        # straight from (transaction, catalog[slot]) without row views
+        pairs = enriched_transactions.iter_pairs()
+    else:
+        pairs = _enriched_pairs(enriched_transactions)
     with open(filename, "w") as f:
-        f.write("|".join(headers) + "\n")
+        write = _enriched_writer(f)
+        for base, enrichment in pairs:
+            write(base, enrichment)
 
-        for tx in enriched_transactions:
-            row = [
-                str(tx.get("TransactionID", "")),
-                str(tx.get("Date", "")),
-                str(tx.get("ProductID", "")),
-                str(tx.get("ProductName", "")),
-                str(tx.get("Quantity", "")),
-                str(tx.get("UnitPrice", "")),
-                str(tx.get("CustomerID", "")),
-                str(tx.get("Region", "")),
-                str(tx.get("API_Category", "")),
-                str(tx.get("API_Brand", "")),
-                str(tx.get("API_Rating", "")),
-                str(tx.get("API_Match", "")),
-            ]
-            f.write("|".join(row) + "\n")
-
-
-def fetch_all_products(n=100):
+
+def _summarize_product(p):
+    return {
+        "id": p.get("id"),
+        "title": p.get("title"),
+        "category": p.get("category"),
+        "brand": p.get("brand"),
+        "price": p.get("price"),
+        "rating": p.get("rating"),
+    }
+
+@instrumented()
+def fetch_all_products(n=100, base_url=BASE_URL):
+    start = time.perf_counter()
     try:
-        url = build_url(BASE_URL, "products", {"limit": n})
+        url = build_url(base_url, "products", {"limit": n})
         response = requests.get(url, timeout=5)
         response.raise_for_status()
+        record_api_call(time.perf_counter() - start)
 
         data = response.json()
         products = data.get("products", [])
-        result = []
-        for p in products:
-            result.append({
-                "id": p.get("id"),
-                "title": p.get("title"),
-                "category": p.get("category"),
-                "brand": p.get("brand"),
-                "price": p.get("price"),
-                "rating": p.get("rating"),
-            })
+        result = [_summarize_product(p) for p in products]
         print("Successfully Fetched products!")
-        return json.dumps(result, indent=4)
+        return result
     except Exception as e:
+        record_api_call(time.perf_counter() - start, ok=False)
         logging.error("Error while fetching all products:", exc_info=e)
         return []
 
+def _revalidate_products(cache, key, url, entry, n, base_url, page_size, max_workers):
+    """
+    Refetches a cached catalog through fetch_catalog_pages. Each page is
+    revalidated against the ETag it was cached with, so unchanged pages
+    cost a 304 and keep their cached products.
 
-def create_product_mapping(api_products):
-    api_products = json.loads(api_products)
-    result = {}
-    for p in api_products:
-        result[int(p.get("id"))] = {
-            "id": p.get("id"),
-            "title": p.get("title"),
-            "category": p.get("category"),
-            "brand": p.get("brand"),
-            "price": p.get("price"),
-            "rating": p.get("rating"),
-        }
+    The entry is only replaced (and its fetched_at renewed) when every
+    page came back as a 200 or a 304; a partial or offline fetch returns
+    what it has, cached pages included, and leaves the entry alone so the
+    next run tries again.
 
-    return result
+    Returns the products, or None when nothing could be fetched.
+    """
+    _, pages, complete = fetch_catalog_pages(
+        total=n, page_size=page_size, max_workers=max_workers, base_url=base_url,
+        cached_pages=entry["pages"] if entry else None,
+    )
+    if complete:
+        cache.put(key, {"url": url, "fetched_at": time.time(), "pages": pages})
+    elif not pages:
+        return None
+    else:
+        logging.warning("Product catalog only partly fetched; cached entry left as it was")
+    return _cached_products(pages)
 
+def _cached_products(pages):
+    """Products of cached pages, in catalog (skip) order."""
+    return [p for skip in sorted(pages, key=int) for p in pages[skip]["products"]]
 
+def fetch_products_cached(n=100, base_url=BASE_URL, cache=None, page_size=100, max_workers=8):
+    """
+    fetch_products_paginated backed by the on-disk CatalogCache.
 
-def enrich_sales_data(transactions, product_mapping):
-    transactions = json.loads(transactions)
-    enriched_transactions = []
+    Fresh entries are returned without touching the network, stale ones are
+    returned immediately while a conditional refresh runs in the background,
+    and expired or missing ones are refreshed first. If the network is down
+    the last cached catalog (however old) is used, then [].
+    """
+    cache = cache or CatalogCache()
+    params = {"limit": n, "page_size": page_size}
+    url = build_url(base_url, "products", {"limit": n})
+    key = cache.key_for(url, params)
+    entry = cache.get(key)
 
-    for tx in transactions:
-        enriched = tx.copy()
+    def refresh():
+        return _revalidate_products(cache, key, url, entry, n, base_url, page_size, max_workers)
+
+    state = cache.freshness(entry)
+    count(f"catalog_cache.{state}")
+    if state == "fresh":
+        return _cached_products(entry["pages"])
+    if state == "stale":
+        cache.refresh_in_background(key, refresh)
+        return _cached_products(entry["pages"])
+
+    products = refresh()
+    if products is not None:
+        return products
+    return _cached_products(entry["pages"]) if entry else []
+
+def _add_to_mapping(mapping, api_products):
+    for p in api_products:
+        mapping[int(p.get("id"))] = _summarize_product(p)
+    return mapping
+
+def create_product_mapping(api_products):
+    if isinstance(api_products, str):
+        api_products = json.loads(api_products)
+    return _add_to_mapping({}, api_products)
+
+def make_session(pool_size=8):
+    """requests.Session whose connection pool can serve pool_size threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def fetch_product_page(session, skip, limit, base_url=BASE_URL, retries=3, backoff=0.5, timeout=5,
+                       cached=None):
+    """
+    Fetches one skip/limit page of the catalog, retrying failed requests
+    with exponential backoff (backoff, 2*backoff, 4*backoff, ...).
 
+    cached is an earlier copy of the page (with the "etag" it was served
+    with): the request is made conditional and cached itself is returned
+    on a 304. Fresh pages carry their ETag under "etag".
+    """
+    url = build_url(base_url, "products", {"limit": limit, "skip": skip})
+    headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else {}
+    for attempt in range(retries + 1):
+        start = time.perf_counter()
         try:
-            product_id_str = tx.get("ProductID", "")
-            numeric_id = int("".join(filter(str.isdigit, product_id_str)))
+            response = session.get(url, headers=headers, timeout=timeout)
+            if response.status_code == 304 and not cached:
+                # nothing to reuse: a 304 is a miss, so ask again unconditionally
+                response = session.get(url, timeout=timeout)
+            if response.status_code == 304 and cached:
+                record_api_call(time.perf_counter() - start, retry=attempt > 0)
+                return cached
+            response.raise_for_status()
+            data = response.json()
+            data["etag"] = response.headers.get("ETag")
+            record_api_call(time.perf_counter() - start, retry=attempt > 0)
+            return data
+        except (requests.RequestException, ValueError) as e:
+            record_api_call(time.perf_counter() - start, ok=False, retry=attempt > 0)
+            if attempt == retries:
+                raise
+            logging.warning(f"Retrying product page skip={skip} after error: {e}")
+            time.sleep(backoff * 2 ** attempt)
 
-            api_product = product_mapping.get(numeric_id)
+def fetch_catalog_pages(total=None, page_size=100, max_workers=8, base_url=BASE_URL,
+                        retries=3, backoff=0.5, product_mapping=None, cached_pages=None):
+    """
+    Fetches the catalog as skip/limit pages issued concurrently.
 
-            if api_product:
-                enriched["API_Category"] = api_product.get("category")
-                enriched["API_Brand"] = api_product.get("brand")
-                enriched["API_Rating"] = api_product.get("rating")
-                enriched["API_Match"] = True
-            else:
-                enriched["API_Category"] = None
-                enriched["API_Brand"] = None
-                enriched["API_Rating"] = None
-                enriched["API_Match"] = False
+    The first page reports the catalog size (unless total is given); the
+    remaining pages are issued over a pooled session by at most max_workers
+    threads and merged into the mapping as each one completes. Pages that
+    still fail after their retries are logged and skipped.
+
+    cached_pages, if given, holds earlier pages keyed by str(skip) as
+    {"etag", "total", "products"}: those pages are revalidated with
+    If-None-Match (a 304 reuses the cached products) and a page that keeps
+    failing falls back to its cached copy.
 
+    Returns (mapping, pages, complete): the product mapping, this fetch's
+    pages in the cached_pages format (fallback copies included), and
+    whether every page was fetched or revalidated with a 304.
+    """
+    mapping = product_mapping if product_mapping is not None else {}
+    cached_pages = cached_pages or {}
+    pages = {}
+    complete = True
+    if total == 0:
+        # limit=0 means "everything" to the API, not an empty page
+        return mapping, pages, complete
+
+    def fetch_page(skip, limit):
+        nonlocal complete
+        cached = cached_pages.get(str(skip))
+        try:
+            page = fetch_product_page(session, skip, limit, base_url, retries, backoff, cached=cached)
         except Exception:
-            enriched["API_Category"] = None
-            enriched["API_Brand"] = None
-            enriched["API_Rating"] = None
-            enriched["API_Match"] = False
+            complete = False
+            if cached is None:
+                raise
+            logging.warning(f"Using cached product page skip={skip}")
+            page = cached
+        if page is not cached:
+            page = {
+                "etag": page.get("etag"),
+                "total": page.get("total", 0),
+                "products": [_summarize_product(p) for p in page.get("products", [])],
+            }
+        pages[str(skip)] = page
+        return page
+
+    session = make_session(max_workers)
+    try:
+        first_limit = min(page_size, total) if total is not None else page_size
+        try:
+            first = fetch_page(0, first_limit)
+        except Exception as e:
+            logging.error("Error while fetching product catalog:", exc_info=e)
+            return mapping, pages, False
+        _add_to_mapping(mapping, first.get("products", []))
+
+        if total is None:
+            total = first.get("total", 0)
+        skips = range(first_limit, total, page_size)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(fetch_page, skip, min(page_size, total - skip)): skip
+                for skip in skips
+            }
+            for future in as_completed(futures):
+                try:
+                    _add_to_mapping(mapping, future.result().get("products", []))
+                except Exception as e:
+                    logging.error(f"Giving up on product page skip={futures[future]}", exc_info=e)
+    finally:
+        session.close()
+
+    return mapping, pages, complete
+
+@instrumented()
+def fetch_products_paginated(total=None, page_size=100, max_workers=8, base_url=BASE_URL,
+                             retries=3, backoff=0.5, product_mapping=None):
+    """
+    Builds a product mapping from skip/limit pages fetched concurrently
+    (see fetch_catalog_pages).
+
+    Returns: product mapping in the create_product_mapping format
+    """
+    return fetch_catalog_pages(
+        total, page_size, max_workers, base_url, retries, backoff, product_mapping
+    )[0]
+
+@instrumented()
+def load_product_mapping(n=100, base_url=BASE_URL, cache=None, max_workers=8):
+    """Product mapping for enrichment, served from the catalog cache."""
+    return create_product_mapping(fetch_products_cached(n, base_url, cache, max_workers=max_workers))
+
+
+
+def parse_product_id(product_id_str):
+    """Numeric catalog id of a ProductID like "P101", or None."""
+    try:
+        return int("".join(filter(str.isdigit, product_id_str)))
+    except (TypeError, ValueError):
+        return None
+
+class ProductIndex:
+    """
+    Resolves ProductIDs to catalog slots, each distinct ProductID once.
+
+    catalog[slot] is a read-only dict of the enrichment columns for that
+    product; slot 0 is the shared "no match" entry. Enriched rows are
+    EnrichedRow views over (catalog[slot], base row), so joining never
+    copies the transaction itself.
+    """
+
+    def __init__(self, product_mapping):
+        self.product_mapping = product_mapping
+        self.catalog = [MappingProxyType({
+            "API_Category": None,
+            "API_Brand": None,
+            "API_Rating": None,
+            "API_Match": False,
+        })]
+        self._slot_by_numeric_id = {}
+        self._slot_by_product_id = {}
+
+    def slot(self, product_id):
+        slot = self._slot_by_product_id.get(product_id)
+        if slot is None:
+            slot = self._slot_by_product_id[product_id] = self._resolve(product_id)
+        return slot
+
+    def _resolve(self, product_id):
+        numeric_id = parse_product_id(product_id)
+        api_product = self.product_mapping.get(numeric_id) if numeric_id is not None else None
+        if not api_product:
+            return 0
+
+        slot = self._slot_by_numeric_id.get(numeric_id)
+        if slot is None:
+            slot = self._slot_by_numeric_id[numeric_id] = len(self.catalog)
+            self.catalog.append(MappingProxyType({
+                "API_Category": api_product.get("category"),
+                "API_Brand": api_product.get("brand"),
+                "API_Rating": api_product.get("rating"),
+                "API_Match": True,
+            }))
+        return slot
+
+    def product(self, product_id):
+        """Catalog entry (product_mapping value) for a ProductID, or None."""
+        numeric_id = parse_product_id(product_id)
+        return self.product_mapping.get(numeric_id) if self.slot(product_id) else None
+
+    def enrichment(self, product_id):
+        return self.catalog[self.slot(product_id)]
+
+    def join(self, transactions):
+        """Enriches a whole batch at once; returns an EnrichedBatch."""
+        slot = self.slot
+        slots = [slot(tx.get("ProductID", "")) for tx in transactions]
+        return EnrichedBatch(transactions, slots, self.catalog)
+
+def as_product_index(product_mapping):
+    if isinstance(product_mapping, ProductIndex):
+        return product_mapping
+    return ProductIndex(product_mapping or {})
+
+def iter_enrich_sales_data(transactions, product_mapping):
+    index = as_product_index(product_mapping)
+    enrichment = index.enrichment
+    for tx in transactions:
+        yield EnrichedRow(enrichment(tx.get("ProductID", "")), tx)
 
-        enriched_transactions.append(enriched)
+@instrumented()
+def enrich_sales_data(transactions, product_mapping, columns_dir=None,
+                      enriched_file="Data/enriched_sales_data.txt", source_file=None):
+    enriched_transactions = as_product_index(product_mapping).join(as_batch(transactions))
 
     # Save to file as required
-    save_enriched_data(enriched_transactions)
-    return json.dumps(enriched_transactions, indent=4)
+    save_enriched_data(enriched_transactions, enriched_file)
+    # optional typed, memory-mappable copy (see utils.columnar); source_file
+    # marks it reusable while that file is unchanged
+    if columns_dir:
+        save_enriched_columns(enriched_transactions, columns_dir, source_file)
+    return enriched_transactions
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+CATALOG_CACHE_DIR = "./Output/cache/catalog"
+CATALOG_TTL_SECONDS = 24 * 60 * 60
+CATALOG_STALE_SECONDS = 7 * 24 * 60 * 60
+
+
+class CatalogCache:
+    """
+    On-disk cache of product catalog responses, one JSON file per request.
+
+    Entries are {"url", "fetched_at", "pages"}, pages being the catalog
+    pages keyed by skip as fetch_catalog_pages returns them.
+    An entry younger than ttl is fresh; up to ttl + stale_ttl it is stale
+    (served while a background refresh runs); after that it is expired and
+    must be refreshed before use, though it is still the offline fallback.
+    Writes go to a temp file that is renamed into place, so readers never
+    see a partial entry.
+    """
+
+    def __init__(self, cache_dir=CATALOG_CACHE_DIR, ttl=CATALOG_TTL_SECONDS,
+                 stale_ttl=CATALOG_STALE_SECONDS):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # key -> (mtime_ns, entry): repeat loads skip the JSON decode
+        self._memory = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(url, params):
+        raw = json.dumps({"url": url, "params": params}, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        cached = self._memory.get(key)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error("Unreadable catalog cache entry", exc_info=e)
+            return None
+        self._memory[key] = (mtime_ns, entry)
+        return entry
+
+    def put(self, key, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self.path_for(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._memory.pop(key, None)
+
+    def freshness(self, entry, now=None):
+        if entry is None:
+            return "missing"
+        age = (now if now is not None else time.time()) - entry.get("fetched_at", 0)
+        if age < self.ttl:
+            return "fresh"
+        if age < self.ttl + self.stale_ttl:
+            return "stale"
+        return "expired"
+
+    def refresh_in_background(self, key, refresh):
+        """Runs refresh() in a thread unless one is already running for key."""
+        with self._lock:
+            if key in self._refreshing:
+                return None
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                refresh()
+            except Exception as e:
+                logging.error("Background catalog refresh failed", exc_info=e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        # daemon: a run that is done with the stale catalog does not wait for
+        # the refresh (put() is atomic, so an interrupted one leaves no partial entry)
+        thread = threading.Thread(target=run, name=f"catalog-refresh-{key[:8]}", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,427 @@
+"""
+Optional columnar (NumPy) representation of parsed transactions.
+
+Quantity is held as int32, UnitPrice as int64 paise, and Region, ProductName,
+CustomerID and Date as int32 dictionary codes assigned in first-seen order
+(-1 marks a blank value). The metric functions below are vectorized
+counterparts of the ones in utils.data_processor and return identical
+results, including tie ordering. save_enriched_columns and
+load_enriched_columns persist enriched transactions in a typed,
+memory-mappable column layout (documented below); a save that records
+its source file is reused by later runs while enriched_columns_current()
+says that file is unchanged. NumPy is only needed when this module is
+actually used.
+"""
+import json
+import os
+
+from utils.aggregation import REGIONS
+from utils.money import PAISE_PER_RUPEE, divide_paise
+from utils.parse_cache import content_digest
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+
+# integers up to this are exact in float64
+FLOAT_EXACT_LIMIT = 2 ** 53
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("numpy is required for the columnar transaction store")
+
+
+def _encode(value, index):
+    if not value:
+        return -1
+    code = index.get(value)
+    if code is None:
+        code = index[value] = len(index)
+    return code
+
+
+class ColumnarTransactions:
+    def __init__(self, quantity, unit_price, region_codes, regions, product_codes,
+                 products, customer_codes, customers, date_codes, dates):
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.region_codes = region_codes
+        self.regions = regions
+        self.product_codes = product_codes
+        self.products = products
+        self.customer_codes = customer_codes
+        self.customers = customers
+        self.date_codes = date_codes
+        self.dates = dates
+        # int64 paise, so every sum below is exact like the dict path
+        self.amount = quantity.astype(np.int64) * unit_price
+
+    def __len__(self):
+        return len(self.quantity)
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        """Dictionary-encodes an iterable of transaction records."""
+        _require_numpy()
+        region_index = {region: i for i, region in enumerate(REGIONS)}
+        product_index, customer_index, date_index = {}, {}, {}
+        quantity, unit_price = [], []
+        region_codes, product_codes, customer_codes, date_codes = [], [], [], []
+
+        for txn in transactions:
+            quantity.append(txn.get("Quantity", 0))
+            unit_price.append(txn.get("UnitPrice", 0))
+            region_codes.append(_encode(txn.get("Region"), region_index))
+            product_codes.append(_encode((txn.get("ProductName") or "").strip(), product_index))
+            customer_codes.append(_encode((txn.get("CustomerID") or "").strip(), customer_index))
+            date_codes.append(_encode((txn.get("Date") or "").strip(), date_index))
+
+        return cls(
+            np.array(quantity, dtype=np.int32),
+            np.array(unit_price, dtype=np.int64),
+            np.array(region_codes, dtype=np.int32),
+            list(region_index),
+            np.array(product_codes, dtype=np.int32),
+            list(product_index),
+            np.array(customer_codes, dtype=np.int32),
+            list(customer_index),
+            np.array(date_codes, dtype=np.int32),
+            list(date_index),
+        )
+
+    def group_sum(self, codes, size, weights=None):
+        """Per-code sums (or counts) over rows with a non-blank code."""
+        mask = codes >= 0
+        if weights is None:
+            return np.bincount(codes[mask], minlength=size)
+        codes, weights = codes[mask], weights[mask]
+        if np.abs(weights).sum() < FLOAT_EXACT_LIMIT:
+            # bincount sums in float64, which is exact for integers while
+            # every partial sum stays below 2**53
+            return np.rint(np.bincount(codes, weights=weights, minlength=size)).astype(weights.dtype)
+        # beyond that only the (much slower, unbuffered) add.at is exact
+        sums = np.zeros(size, dtype=weights.dtype)
+        np.add.at(sums, codes, weights)
+        return sums
+
+    def distinct_pair_counts(self, outer_codes, outer_size, inner_codes, inner_size):
+        """Number of distinct inner codes seen with each outer code."""
+        mask = (outer_codes >= 0) & (inner_codes >= 0)
+        keys = outer_codes[mask].astype(np.int64) * inner_size + inner_codes[mask]
+        keys.sort()
+        pairs = keys[_run_starts(keys)]
+        return np.bincount(pairs // inner_size, minlength=outer_size)
+
+
+def _run_starts(sorted_values):
+    """Mask of the first element of each run of equal values."""
+    starts = np.empty(len(sorted_values), dtype=bool)
+    starts[:1] = True
+    np.not_equal(sorted_values[1:], sorted_values[:-1], out=starts[1:])
+    return starts
+
+
+def _top_indices(values, n):
+    """Indices of the n largest values, ties broken by lower index first."""
+    size = len(values)
+    if n >= size:
+        candidates = np.arange(size)
+    elif n <= 0:
+        return np.arange(0)
+    else:
+        kth = np.partition(values, size - n)[size - n]
+        above = np.flatnonzero(values > kth)
+        ties = np.flatnonzero(values == kth)[: n - len(above)]
+        candidates = np.concatenate([above, ties])
+    return candidates[np.lexsort((candidates, -values[candidates]))]
+
+
+def calculate_total_revenue(store):
+    return int(store.amount.sum())
+
+def region_wise_sale(store, as_json=True):
+    total_sales = calculate_total_revenue(store)
+    sales = store.group_sum(store.region_codes, len(store.regions), store.amount)
+    counts = store.group_sum(store.region_codes, len(store.regions))
+
+    out = {}
+    for code in np.argsort(-sales, kind="stable"):
+        out[store.regions[code]] = {
+            "transaction_count": int(counts[code]),
+            "total_sales": int(sales[code]),
+            "percentage": round(int(sales[code]) / total_sales * 100, 2),
+        }
+    return json.dumps(out, indent=4) if as_json else out
+
+def _product_totals(store):
+    size = len(store.products)
+    quantity = store.group_sum(store.product_codes, size, store.quantity.astype(np.int64))
+    revenue = store.group_sum(store.product_codes, size, store.amount)
+    return quantity, revenue
+
+def top_selling_products(store, n=5):
+    """
+    Finds top n products by total quantity sold
+
+    Returns: list of tuples
+    """
+    quantity, revenue = _product_totals(store)
+    return [
+        (store.products[code], int(quantity[code]), int(revenue[code]))
+        for code in _top_indices(quantity, n)
+    ]
+
+def customer_analysis(store, as_json=True):
+    size = len(store.customers)
+    spent = store.group_sum(store.customer_codes, size, store.amount)
+    counts = store.group_sum(store.customer_codes, size)
+
+    # distinct (customer, product) pairs, kept in first-purchase order
+    mask = (store.customer_codes >= 0) & (store.product_codes >= 0)
+    rows = np.flatnonzero(mask)
+    keys = store.customer_codes[rows].astype(np.int64) * len(store.products) + store.product_codes[rows]
+    # first row of each distinct pair: a stable sort keeps the earliest row first
+    order = np.argsort(keys, kind="stable")
+    first = np.sort(order[_run_starts(keys[order])])
+    pair_rows = rows[first]
+    pair_rows = pair_rows[np.argsort(store.customer_codes[pair_rows], kind="stable")]
+    bounds = np.searchsorted(store.customer_codes[pair_rows], np.arange(size + 1)).tolist()
+
+    # plain lists from here on: the loop runs once per customer
+    products = store.products
+    bought = [products[p] for p in store.product_codes[pair_rows].tolist()]
+    spent_list, counts_list = spent.tolist(), counts.tolist()
+    out = {}
+    for code in np.argsort(-spent, kind="stable").tolist():
+        purchase_count = counts_list[code]
+        total_spent = spent_list[code]
+        out[store.customers[code]] = {
+            "total_spent": total_spent,
+            "purchase_count": purchase_count,
+            "products_bought": bought[bounds[code]:bounds[code + 1]],
+            "avg_order_value": divide_paise(total_spent, purchase_count),
+        }
+    return json.dumps(out, indent=4) if as_json else out
+
+def daily_sales_trend(store, as_json=True):
+    size = len(store.dates)
+    revenue = store.group_sum(store.date_codes, size, store.amount)
+    counts = store.group_sum(store.date_codes, size)
+    unique_customers = store.distinct_pair_counts(
+        store.date_codes, size, store.customer_codes, len(store.customers)
+    )
+
+    out = {}
+    for code in sorted(range(size), key=lambda c: store.dates[c]):
+        out[store.dates[code]] = {
+            "revenue": int(revenue[code]),
+            "transaction_count": int(counts[code]),
+            "unique_customers": int(unique_customers[code]),
+        }
+    return json.dumps(out, indent=4) if as_json else out
+
+def find_peak_sales_day(store):
+    size = len(store.dates)
+    revenue = store.group_sum(store.date_codes, size, store.amount)
+    counts = store.group_sum(store.date_codes, size)
+    # argmax returns the first maximum, as max() over first-seen dates does
+    code = int(np.argmax(revenue))
+    return (store.dates[code], int(revenue[code]), int(counts[code]))
+
+def low_performing_products(store, threshold=10):
+    quantity, revenue = _product_totals(store)
+    codes = np.flatnonzero(quantity < threshold)
+    codes = codes[np.argsort(quantity[codes], kind="stable")]
+    return [
+        (store.products[code], int(quantity[code]), int(revenue[code]))
+        for code in codes
+    ]
+
+
+# On-disk layout of enriched transactions written by save_enriched_columns:
+#
+#   <directory>/manifest.json       {"format": ENRICHED_FORMAT, "version": 2,
+#                                    "rows": n, "columns": {name: kind},
+#                                    "source": {"path", "size", "mtime_ns",
+#                                               "digest"} or null}
+#   <directory>/<column>.npy        one array of n values per column
+#   <directory>/<column>.dict.npy   dictionary (unicode array) of a "coded" column
+#
+# Column kinds: "text" (unicode array), "coded" (int32 codes into the
+# dictionary, -1 for None), "int32", "int64", "float64" (NaN for None) and
+# "bool". UnitPrice is int64 paise since version 2; version 1 stored float64
+# rupees and is converted on load.
+# Plain .npy files are used rather than a zipped .npz so every column can
+# be memory-mapped. manifest.json is written last and marks a complete save.
+# "source" identifies the cleaned file the rows are (all of) the enriched
+# form of; saves without one are never picked up by enriched_columns_current.
+ENRICHED_FORMAT = "sales-enriched-columns"
+ENRICHED_VERSION = 2
+ENRICHED_COLUMNS = {
+    "TransactionID": "text",
+    "Date": "coded",
+    "ProductID": "coded",
+    "ProductName": "coded",
+    "Quantity": "int32",
+    "UnitPrice": "int64",
+    "CustomerID": "coded",
+    "Region": "coded",
+    "API_Category": "coded",
+    "API_Brand": "coded",
+    "API_Rating": "float64",
+    "API_Match": "bool",
+}
+
+
+def _unicode_array(values):
+    return np.array(values, dtype=str) if values else np.array([], dtype="<U1")
+
+def save_enriched_columns(enriched_transactions, directory, source_file=None):
+    """
+    Writes enriched transactions in the documented .npy column layout.
+    Pass source_file when they are every row of that file, enriched.
+    """
+    _require_numpy()
+    values = {name: [] for name in ENRICHED_COLUMNS}
+    indexes = {name: {} for name, kind in ENRICHED_COLUMNS.items() if kind == "coded"}
+
+    for tx in enriched_transactions:
+        for name, kind in ENRICHED_COLUMNS.items():
+            value = tx.get(name)
+            if kind == "coded":
+                if value is None:
+                    value = -1
+                else:
+                    index = indexes[name]
+                    code = index.get(value)
+                    if code is None:
+                        code = index[value] = len(index)
+                    value = code
+            elif kind == "float64" and value is None:
+                value = np.nan
+            values[name].append(value)
+
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    for name, kind in ENRICHED_COLUMNS.items():
+        if kind == "text":
+            array = _unicode_array([str(v) for v in values[name]])
+        elif kind == "coded":
+            array = np.array(values[name], dtype=np.int32)
+            np.save(os.path.join(directory, f"{name}.dict.npy"), _unicode_array(list(indexes[name])))
+        else:
+            array = np.array(values[name], dtype=kind)
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+
+    with open(manifest_path, "w") as f:
+        json.dump({
+            "format": ENRICHED_FORMAT,
+            "version": ENRICHED_VERSION,
+            "rows": len(values["TransactionID"]),
+            "columns": ENRICHED_COLUMNS,
+            "source": _source_stamp(source_file) if source_file else None,
+        }, f, indent=4)
+
+def _source_stamp(source_file):
+    stat = os.stat(source_file)
+    return {
+        "path": os.path.abspath(source_file),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "digest": content_digest(source_file),
+    }
+
+def enriched_columns_current(directory, source_file):
+    """
+    True when directory holds a complete save of source_file's current
+    content: same stat, or same content hash after a rewrite.
+    """
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            source = json.load(f).get("source")
+        stat = os.stat(source_file)
+    except (OSError, ValueError):
+        return False
+    if not source or source["path"] != os.path.abspath(source_file):
+        return False
+    if (source["size"], source["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+        return True
+    return source["digest"] == content_digest(source_file)
+
+def load_enriched_columns(directory, mmap=True):
+    """Opens a save_enriched_columns directory, memory-mapped by default."""
+    _require_numpy()
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != ENRICHED_FORMAT:
+        raise ValueError(f"{directory} is not an enriched sales column directory")
+
+    mmap_mode = "r" if mmap else None
+    columns, dictionaries = {}, {}
+    for name, kind in manifest["columns"].items():
+        columns[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+        if kind == "coded":
+            dictionaries[name] = np.load(os.path.join(directory, f"{name}.dict.npy")).tolist()
+
+    kinds = manifest["columns"]
+    if manifest.get("version", 1) < 2 and kinds.get("UnitPrice") == "float64":
+        columns["UnitPrice"] = np.rint(columns["UnitPrice"] * PAISE_PER_RUPEE).astype(np.int64)
+        kinds = dict(kinds, UnitPrice="int64")
+    return EnrichedColumns(manifest["rows"], kinds, columns, dictionaries)
+
+
+class EnrichedColumns:
+    def __init__(self, rows, kinds, columns, dictionaries):
+        self.rows = rows
+        self.kinds = kinds
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    def __len__(self):
+        return self.rows
+
+    def iter_records(self):
+        """Yields enriched transactions as typed dicts (None restored)."""
+        decoded = {}
+        for name, kind in self.kinds.items():
+            column = self.columns[name]
+            if kind == "coded":
+                dictionary = self.dictionaries[name]
+                decoded[name] = [dictionary[c] if c >= 0 else None for c in column.tolist()]
+            elif kind == "float64":
+                decoded[name] = [None if v != v else v for v in column.tolist()]
+            else:
+                decoded[name] = column.tolist()
+        names = list(self.kinds)
+        for row in zip(*(decoded[name] for name in names)):
+            yield dict(zip(names, row))
+
+    def _recode(self, name, index, normalize):
+        """Maps stored codes onto a ColumnarTransactions dictionary."""
+        remap = [_encode(normalize(value), index) for value in self.dictionaries[name]]
+        lookup = np.array(remap + [-1], dtype=np.int32)
+        return lookup[self.columns[name]]
+
+    def to_store(self):
+        """ColumnarTransactions over these columns, for the vectorized metrics."""
+        region_index = {region: i for i, region in enumerate(REGIONS)}
+        product_index, customer_index, date_index = {}, {}, {}
+        strip = lambda value: value.strip()
+        return ColumnarTransactions(
+            np.asarray(self.columns["Quantity"], dtype=np.int32),
+            np.asarray(self.columns["UnitPrice"], dtype=np.int64),
+            self._recode("Region", region_index, lambda value: value),
+            list(region_index),
+            self._recode("ProductName", product_index, strip),
+            list(product_index),
+            self._recode("CustomerID", customer_index, strip),
+            list(customer_index),
+            self._recode("Date", date_index, strip),
+            list(date_index),
+        )
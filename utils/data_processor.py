@@ -1,28 +1,149 @@
+import heapq
 import json
 import logging
-from collections import defaultdict
 
+from utils.aggregation import SalesAggregate
+from utils.metrics import instrumented, stage
+from utils.money import divide_paise, to_paise
+from utils.transactions import as_batch
+from utils.validation import VALIDITY_RULES, count_reject
 
-def calculate_total_revenue(transactions):
-    transactions = json.loads(transactions)
-    return sum([txn["Quantity"] * txn["UnitPrice"] for txn in transactions])
-
-def region_wise_sale(transactions):
-    out = {
-        "North": {"transaction_count": 0, "total_sales": 0.0},
-        "South": {"transaction_count": 0, "total_sales": 0.0},
-        "West": {"transaction_count": 0, "total_sales": 0.0},
-        "East": {"transaction_count": 0, "total_sales": 0.0},
+
+def aggregate_sales(transactions, sketch=False):
+    """
+    Builds the single-pass SalesAggregate behind every metric below.
+
+    Accepts a TransactionBatch, any iterable of transaction records, or an
+    already built SalesAggregate (returned as is). sketch=True opts into
+    approximate distinct counts (see SalesAggregate).
+    """
+    if isinstance(transactions, SalesAggregate):
+        return transactions
+    with stage("aggregate_sales") as record:
+        aggregate = SalesAggregate(sketch=sketch).update(as_batch(transactions))
+        record.rows_in = record.rows_out = aggregate.record_count
+    return aggregate
+
+def new_filter_summary():
+    return {
+        "total_input": 0,
+        "invalid": 0,
+        "filtered_by_region": 0,
+        "filtered_by_amount": 0,
+        "final_count": 0,
+        "rejected": {},
     }
-    try:
-        total_sales = calculate_total_revenue(transactions)
-        transactions = json.loads(transactions)
-        for txn in transactions:
-            if not txn["Region"]:
+
+def iter_validate_and_filter(transactions, filter_summary, region=None, min_amount=None, max_amount=None,
+                             rules=VALIDITY_RULES):
+    """
+    Streaming form of main.validate_and_filter: yields the transactions
+    that pass and keeps the filter_summary counters current. min_amount and
+    max_amount are in rupees; amounts are compared in paise.
+
+    Rows breaking a validity rule count as invalid and per rule under
+    filter_summary["rejected"]; rules=None skips the check for rows that
+    were already validated (e.g. together with the cleaning rules).
+    """
+    check = rules.predicate("record") if rules is not None else None
+    if min_amount is not None:
+        min_amount = to_paise(min_amount)
+    if max_amount is not None:
+        max_amount = to_paise(max_amount)
+    for transaction in transactions:
+        filter_summary["total_input"] += 1
+        if check is not None:
+            failed = check(transaction)
+            if failed is not None:
+                filter_summary["invalid"] += 1
+                count_reject(filter_summary, failed)
                 continue
-            sale_amount = txn["Quantity"] * txn["UnitPrice"]
-            out[txn["Region"]]["transaction_count"] += 1
-            out[txn["Region"]]["total_sales"] += sale_amount
+
+        amount = transaction.get("Quantity", 0) * transaction.get("UnitPrice", 0)
+
+        if region and region != transaction.get("Region"):
+            filter_summary["filtered_by_region"] += 1
+            continue
+
+        if min_amount is not None and amount < min_amount:
+            filter_summary["filtered_by_amount"] += 1
+            continue
+
+        if max_amount is not None and amount > max_amount:
+            filter_summary["filtered_by_amount"] += 1
+            continue
+
+        filter_summary["final_count"] += 1
+        yield transaction
+
+def top_k(items, k, key):
+    """
+    The k largest items by key, ties kept in input order.
+
+    Same result as sorted(items, key=key, reverse=True)[:k] but uses a
+    bounded heap, so it costs O(n log k) instead of a full sort. k=None
+    means no limit.
+    """
+    if k is None:
+        return sorted(items, key=key, reverse=True)
+    return heapq.nlargest(k, items, key=key)
+
+def top_products(transactions, k=5, by="quantity"):
+    """
+    Top k products by total "quantity" or "revenue".
+
+    Returns: list of (product, total_quantity, total_revenue) tuples
+    """
+    position = 1 if by == "quantity" else 2
+    products = (
+        (product, quantity, revenue)
+        for product, (quantity, revenue) in aggregate_sales(transactions).products.items()
+    )
+    return top_k(products, k, key=lambda item: item[position])
+
+def _customer_summary(data):
+    purchase_count = data["purchase_count"]
+    return {
+        "total_spent": data["total_spent"],
+        "purchase_count": purchase_count,
+        "products_bought": list(data["products_bought"]),
+        "avg_order_value": divide_paise(data["total_spent"], purchase_count),
+    }
+
+def top_customers(transactions, k=5):
+    """
+    Top k customers by total spend; only those k get summarised.
+
+    Returns: list of (customer_id, summary) tuples in customer_analysis format
+    """
+    ranked = top_k(
+        aggregate_sales(transactions).customers.items(), k,
+        key=lambda item: item[1]["total_spent"],
+    )
+    return [(customer_id, _customer_summary(data)) for customer_id, data in ranked]
+
+def top_days(transactions, k=1):
+    """
+    Top k days by revenue, ties in first-seen order.
+
+    Returns: list of (date, revenue, transaction_count) tuples
+    """
+    daily = aggregate_sales(transactions).daily
+    ranked = top_k(daily.items(), k, key=lambda item: item[1]["revenue"])
+    return [(date, data["revenue"], data["transaction_count"]) for date, data in ranked]
+
+@instrumented()
+def calculate_total_revenue(transactions):
+    return aggregate_sales(transactions).total_revenue
+
+@instrumented()
+def region_wise_sale(transactions, as_json=True):
+    out = {}
+    try:
+        aggregate = aggregate_sales(transactions)
+        total_sales = aggregate.total_revenue
+        for region, stats in aggregate.regions.items():
+            out[region] = dict(stats)
 
         # to calculate percentage
         for region in list(out):
@@ -35,12 +156,13 @@ def region_wise_sale(transactions):
             sorted(out.items(), key=lambda item: item[1]["total_sales"], reverse=True)
         )
 
-        return json.dumps(sorted_regions, indent=4)
+        return json.dumps(sorted_regions, indent=4) if as_json else sorted_regions
     except Exception as e:
         logging.error('error', exc_info=e)
         return out
 
 
+@instrumented()
 def top_selling_products(transactions, n=5):
     """
     Finds top n products by total quantity sold
@@ -48,158 +170,76 @@ def top_selling_products(transactions, n=5):
     Returns: list of tuples
     """
     try:
-        transactions = json.loads(transactions)
-        # return json.dumps(transactions,indent=4)
-
-        product_data = defaultdict(lambda: {"total_quantity": 0, "total_revenue": 0.0})
-
-        for txn in transactions:
-            product = txn.get("ProductName", "").strip()
-            quantity = txn.get("Quantity", 0)
-            unit_price = txn.get("UnitPrice", 0)
-
-            if not product:
-                continue
-
-            product_data[product]["total_quantity"] += quantity
-            product_data[product]["total_revenue"] += quantity * unit_price
-
-        result = [
-            (product,
-             data["total_quantity"],
-             data["total_revenue"])
-            for product, data in product_data.items()
-        ]
-
-        # Sort by total quantity sold (descending) and return top n
-        result.sort(key=lambda x: x[1], reverse=True)
-        return result[:n]
+        # heap selection by total quantity sold (descending), not a full sort
+        return top_products(transactions, n, by="quantity")
 
     except Exception as e:
         logging.error("error", exc_info=e)
         return []
 
-def customer_analysis(transactions):
+@instrumented()
+def customer_analysis(transactions, as_json=True, n=None):
+    """
+    Per-customer spend, order count, products bought and average order,
+    highest spenders first. Pass n to keep only the top n customers.
+    """
     try:
-        transactions = json.loads(transactions)
-
-        customers = {}
-
-        for txn in transactions:
-            customer_id = txn.get("CustomerID", "").strip()
-            product = txn.get("ProductName", "").strip()
-            quantity = txn.get("Quantity", 0)
-            unit_price = txn.get("UnitPrice", 0)
-
-            if not customer_id:
-                continue
-
-            order_value = quantity * unit_price
-
-            if customer_id not in customers:
-                customers[customer_id] = {
-                    "total_spent": 0.0,
-                    "purchase_count": 0,
-                    "products_bought": set()
-                }
-
-            customers[customer_id]["total_spent"] += order_value
-            customers[customer_id]["purchase_count"] += 1
-
-            if product:
-                customers[customer_id]["products_bought"].add(product)
-
-        for customer_id, data in customers.items():
-            purchase_count = data["purchase_count"]
+        sorted_customers = dict(top_customers(transactions, n))
 
-            data["avg_order_value"] = round(
-                data["total_spent"] / purchase_count, 2
-            ) if purchase_count else 0.0
-
-            data["products_bought"] = list(set(data["products_bought"]))
-
-        sorted_customers = dict(
-            sorted(
-                customers.items(), key=lambda item: item[1]["total_spent"], reverse=True
-            )
-        )
-
-        return json.dumps(sorted_customers, indent=4)
+        return json.dumps(sorted_customers, indent=4) if as_json else sorted_customers
 
     except Exception as e:
         logging.error("error", exc_info=e)
         return {}
 
-def daily_sales_trend(transactions):
+@instrumented()
+def daily_sales_trend(transactions, as_json=True):
     try:
-        transactions = json.loads(transactions)
-        daily_data = {}
-
-        for txn in transactions:
-            date = txn.get("Date", "").strip()
-            customer_id = txn.get("CustomerID", "").strip()
-            quantity = txn.get("Quantity", 0)
-            unit_price = txn.get("UnitPrice", 0)
-
-            if not date:
-                continue
-
-            revenue = quantity * unit_price
+        aggregate = aggregate_sales(transactions)
 
-            if date not in daily_data:
-                daily_data[date] = {
-                    "revenue": 0.0,
-                    "transaction_count": 0,
-                    "unique_customers": set()
-                }
-
-            daily_data[date]["revenue"] += revenue
-            daily_data[date]["transaction_count"] += 1
-
-            if customer_id:
-                daily_data[date]["unique_customers"].add(customer_id)
-
-        for date, data in daily_data.items():
-            data["unique_customers"] = len(data["unique_customers"])
+        daily_data = {
+            date: {
+                "revenue": data["revenue"],
+                "transaction_count": data["transaction_count"],
+                "unique_customers": len(data["unique_customers"]),
+            }
+            for date, data in aggregate.daily.items()
+        }
 
         sorted_daily_data = dict(
             sorted(daily_data.items(), key=lambda item: item[0])
         )
 
-        return json.dumps(sorted_daily_data, indent=4)
+        return json.dumps(sorted_daily_data, indent=4) if as_json else sorted_daily_data
 
     except Exception as e:
         logging.error("error", exc_info=e)
         return {}
 
-def find_peak_sales_day(transactions):
-    transactions = json.loads(transactions)
-    revenue_by_date = defaultdict(float)
-    count_by_date = defaultdict(int)
+def unique_customers_by_region(transactions):
+    """
+    Distinct customers per region (estimates in sketch mode).
 
-    for txn in transactions:
-        date = txn["Date"]
-        amount = float(txn["Quantity"] * txn["UnitPrice"])
-        revenue_by_date[date] += amount
-        count_by_date[date] += 1
+    Returns: dict of region -> count
+    """
+    aggregate = aggregate_sales(transactions)
+    return {
+        region: len(aggregate.region_customers.get(region, ()))
+        for region in aggregate.regions
+    }
 
-    peak_date = max(revenue_by_date, key=lambda d: revenue_by_date[d])
-    return (peak_date, revenue_by_date[peak_date], count_by_date[peak_date])
+@instrumented()
+def find_peak_sales_day(transactions):
+    return top_days(transactions, 1)[0]
 
+@instrumented()
 def low_performing_products(transactions, threshold=10):
-    transactions = json.loads(transactions)
-    product_stats = defaultdict(lambda: {'quantity': 0, 'revenue': 0.0})
-    for t in transactions:
-        name = t["ProductName"]
-        qty = t["Quantity"]
-        revenue = float(t["Quantity"] * t["UnitPrice"])
-        product_stats[name]["quantity"] += qty
-        product_stats[name]["revenue"] += revenue
+    aggregate = aggregate_sales(transactions)
 
     low_products = [
-        (name, stats["quantity"], stats["revenue"])
-        for name, stats in product_stats.items()
-        if stats["quantity"] < threshold
+        (name, quantity, revenue)
+        for name, (quantity, revenue) in aggregate.products.items()
+        if quantity < threshold
     ]
     low_products.sort(key=lambda x: x[1])
     return low_products
@@ -0,0 +1,215 @@
+import codecs
+import mmap
+import os
+import sys
+from datetime import date, datetime
+from functools import lru_cache
+
+from utils.money import safe_bytes_to_paise, safe_to_paise
+from utils.transactions import TRANSACTION_FIELDS, Transaction
+from utils.validation import CLEANING_RULES, count_reject
+
+ENCODING_SAMPLE_BYTES = 1 << 16
+
+
+def detect_encoding(path, encodings=("utf-8", "latin-1", "cp1252"), sample_size=ENCODING_SAMPLE_BYTES):
+    """
+    Returns the first encoding that cleanly decodes a sample of the file.
+
+    The sample is decoded incrementally so a multi-byte character cut off at
+    the sample boundary does not count as a failure.
+    """
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+    for enc in encodings:
+        try:
+            codecs.getincrementaldecoder(enc)().decode(sample, final=False)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    raise UnicodeDecodeError("utf-8", sample, 0, 1, "Unable to decode file")
+
+def open_with_fallback_encodings(path, encodings=("utf-8", "latin-1", "cp1252")):
+    # open() decodes lazily, so the encoding has to be chosen from the bytes
+    # up front for the fallback to take effect
+    return open(path, "r", encoding=detect_encoding(path, encodings))
+
+@lru_cache(maxsize=8192)
+def parse_iso_date(value):
+    """
+    Validates a YYYY-MM-DD date and returns it in ISO form.
+
+    Dates repeat across millions of rows, so results are cached, and the
+    common well-formed case goes through date.fromisoformat instead of the
+    much slower strptime (kept for anything else, so errors are unchanged).
+    """
+    if len(value) == 10 and value[4] == "-" and value[7] == "-":
+        return date.fromisoformat(value).isoformat()
+    return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+
+@lru_cache(maxsize=8192)
+def parse_date_ordinal(value):
+    return date.fromisoformat(parse_iso_date(value)).toordinal()
+
+def iter_clean_rows(lines, counters, rules=CLEANING_RULES, rejects=None):
+    """
+    Applies the Q1 cleaning rules (a utils.validation RuleSet) to raw
+    pipe-delimited lines (header already consumed) and yields the fields of
+    every valid row.
+
+    counters["total"], counters["invalid"] and the per-rule
+    counters["rejected"] are updated as rows stream by. Rejected lines are
+    written to the rejects file, if given, as "<rule>|<line>".
+    """
+    check = rules.predicate("text")
+    for line in lines:
+        row = line.strip()
+
+        if not row:
+            continue
+        counters["total"] += 1
+
+        fields = row.split('|')
+        failed = check(fields)
+        if failed is None:
+            yield fields
+            continue
+        counters["invalid"] += 1
+        count_reject(counters, failed)
+        if rejects is not None:
+            rejects.write(f"{failed}|{row}\n")
+
+def parse_row(row_data, headings):
+    json_data = {}
+    for index, r in enumerate(row_data):
+        if headings[index] == "Quantity":
+            json_data[headings[index]] = int(r)
+        elif headings[index] == "Date":
+            json_data[headings[index]] = parse_iso_date(r)
+        elif headings[index] == "ProductName":
+            json_data[headings[index]] = r.replace(",", " ")
+        elif headings[index] == "UnitPrice":
+            json_data[headings[index]] = safe_to_paise(r)
+        else:
+            json_data[headings[index]] = r
+    return json_data
+
+def parse_record(row_data):
+    """
+    parse_row for the standard TRANSACTION_FIELDS layout, returning a compact
+    Transaction with interned categorical strings and a date ordinal.
+    """
+    transaction_id, day, product_id, product_name, quantity, unit_price, customer_id, region = row_data
+    return Transaction(
+        transaction_id,
+        parse_date_ordinal(day),
+        sys.intern(product_id),
+        sys.intern(product_name.replace(",", " ")),
+        int(quantity),
+        safe_to_paise(unit_price),
+        sys.intern(customer_id),
+        sys.intern(region),
+    )
+
+def iter_parse_rows(rows, headings, compact=False):
+    if compact:
+        _require_standard_layout(headings)
+        for row_data in rows:
+            yield parse_record(row_data)
+        return
+    for row_data in rows:
+        yield parse_row(row_data, headings)
+
+def _require_standard_layout(headings):
+    if tuple(headings) != TRANSACTION_FIELDS:
+        raise ValueError(f"Compact records need the columns {'|'.join(TRANSACTION_FIELDS)}")
+
+def iter_file_rows(lines):
+    """Yields the split fields of every non-blank line of a cleaned file."""
+    for line in lines:
+        row = line.strip()
+        if not row:
+            continue
+        yield row.split("|")
+
+def _bytes_field_parsers(headings, encoding, compact=False):
+    """One bytes -> value converter per column, matching parse_row/parse_record."""
+    parsers = []
+    for heading in headings:
+        if heading == "Quantity":
+            parsers.append(int)
+        elif heading == "UnitPrice":
+            parsers.append(safe_bytes_to_paise)
+        else:
+            if heading == "Date" and compact:
+                convert = lambda b: parse_date_ordinal(b.decode(encoding))
+            elif heading == "Date":
+                convert = lambda b: parse_iso_date(b.decode(encoding))
+            elif heading == "ProductName":
+                convert = lambda b: b.decode(encoding).replace(",", " ")
+            else:
+                convert = lambda b: b.decode(encoding)
+            if heading == "TransactionID":
+                parsers.append(convert)
+            else:
+                # low-cardinality text columns: decode each distinct value once,
+                # which also shares one string object per value across rows
+                cache = {}
+                def cached(b, cache=cache, convert=convert):
+                    value = cache.get(b)
+                    if value is None:
+                        value = cache[b] = convert(b)
+                    return value
+                parsers.append(cached)
+    return parsers
+
+def iter_mmap_transactions(path, counters=None, clean=True, encodings=("utf-8", "latin-1", "cp1252"),
+                           compact=False, rules=CLEANING_RULES, rejects=None):
+    """
+    Reads a pipe-delimited sales file through mmap and yields parsed
+    transactions equal to parse_row's output.
+
+    Lines and fields are split on raw bytes (safe for the ASCII-compatible
+    encodings supported here) and only fields of rows that are kept get
+    decoded. With clean=True the cleaning rules are applied first, counted
+    into counters like iter_clean_rows (when counters is given) and
+    rejected lines go to rejects. compact=True yields Transaction records
+    instead of dicts.
+    """
+    encoding = detect_encoding(path, encodings)
+    if counters is None:
+        counters = {"total": 0, "invalid": 0}
+    if os.path.getsize(path) == 0:
+        return
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        headings = mm.readline().strip().decode(encoding).split("|")
+        if compact:
+            _require_standard_layout(headings)
+        parsers = _bytes_field_parsers(headings, encoding, compact)
+        check = rules.predicate("bytes") if clean else None
+
+        for line in iter(mm.readline, b""):
+            row = line.strip()
+            if not row:
+                continue
+            counters["total"] += 1
+
+            fields = row.split(b"|")
+            if check is not None:
+                failed = check(fields)
+                if failed is not None:
+                    counters["invalid"] += 1
+                    count_reject(counters, failed)
+                    if rejects is not None:
+                        rejects.write(f"{failed}|{row.decode(encoding)}\n")
+                    continue
+            row = fields
+
+            if compact:
+                yield Transaction(*[parse(field) for parse, field in zip(parsers, row)])
+            else:
+                yield {
+                    heading: parse(field)
+                    for heading, parse, field in zip(headings, parsers, row)
+                }
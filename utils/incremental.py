@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from utils.aggregation import SalesAggregate
+from utils.api_handler import as_product_index
+from utils.file_handler import detect_encoding, iter_file_rows, iter_parse_rows
+
+REPORT_STATE_FILE = "./Output/report_state.json"
+STATE_VERSION = 5
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def _prefix_digest(f, offset):
+    """
+    blake2b of the already processed prefix [0, offset).
+
+    The whole prefix is hashed, so an in-place edit anywhere in it is
+    caught; that is one sequential read with no parsing, far cheaper than
+    the re-parse it guards. The digest is returned unfinished so the
+    appended bytes can be folded in for the next watermark.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    f.seek(0)
+    remaining = offset
+    while remaining:
+        chunk = f.read(min(remaining, HASH_CHUNK_BYTES))
+        if not chunk:
+            break
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return digest
+
+def catalog_fingerprint(index):
+    """Digest of the catalog an enrichment summary was counted against."""
+    catalog = sorted(index.product_mapping.items(), key=lambda item: str(item[0]))
+    raw = json.dumps(catalog, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def _recount_enrichment(aggregate, product_ids, index):
+    """Redoes the enrichment summary from per-ProductID row counts."""
+    aggregate.enrichment_total = aggregate.enriched_count = 0
+    aggregate.unmatched_products = set()
+    for product_id, rows in product_ids.items():
+        aggregate.enrichment_total += rows
+        if index.enrichment(product_id).get("API_Match"):
+            aggregate.enriched_count += rows
+        else:
+            aggregate.unmatched_products.add(product_id)
+
+def load_report_state(state_file=REPORT_STATE_FILE):
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return state if state.get("version") == STATE_VERSION else None
+
+def save_report_state(state, state_file=REPORT_STATE_FILE):
+    directory = os.path.dirname(os.path.abspath(state_file))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def update_sales_aggregate(input_file="./Output/first_question.txt", state_file=REPORT_STATE_FILE,
+                           product_mapping=None, sketch=False):
+    """
+    Brings the persisted SalesAggregate for an append-only cleaned sales
+    file up to date and returns (aggregate, rows_added, rebuilt).
+
+    The state records a watermark (byte offset of the last complete line
+    processed plus a checksum of the bytes before it). If the file still
+    matches the watermark only the appended rows are parsed and added;
+    otherwise (first run, file rewritten or truncated) everything is
+    rebuilt. A trailing partial line is left for the next run. New rows
+    are read in chunks of whole lines, so memory does not grow with the
+    appended region (on a rebuild, the whole file). Switching sketch mode
+    on or off also forces a rebuild.
+
+    New rows are enriched against product_mapping for the enrichment
+    summary. The state keeps a fingerprint of that catalog and the rows
+    per ProductID, so when the catalog changes the summary is recounted
+    for every row instead of only the new ones.
+    """
+    path = os.path.abspath(input_file)
+    state = load_report_state(state_file)
+    encoding = detect_encoding(input_file)
+    index = as_product_index(product_mapping)
+    catalog = catalog_fingerprint(index)
+
+    with open(input_file, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        header = f.readline()
+        header_end = f.tell()
+
+        rebuilt = True
+        if (state and state["path"] == path and state["aggregate"]["sketch"] == sketch
+                and header_end <= state["offset"] <= size):
+            digest = _prefix_digest(f, state["offset"])
+            if digest.hexdigest() == state["checksum"]:
+                rebuilt = False
+
+        if rebuilt:
+            aggregate = SalesAggregate(sketch=sketch)
+            product_ids = {}
+            offset = header_end
+            digest = hashlib.blake2b(header, digest_size=16)
+        else:
+            aggregate = SalesAggregate.from_state(state["aggregate"])
+            product_ids = state["product_ids"]
+            offset = state["offset"]
+
+        headings = header.decode(encoding).strip().split("|")
+        rows_added = 0
+        f.seek(offset)
+        while True:
+            lines = f.readlines(HASH_CHUNK_BYTES)
+            if lines and not lines[-1].endswith(b"\n"):
+                # a line without its newline may still be being written: leave it
+                lines.pop()
+            if not lines:
+                break
+            block = b"".join(lines)
+            digest.update(block)
+            offset += len(block)
+            for txn in iter_parse_rows(iter_file_rows(block.decode(encoding).split("\n")), headings):
+                product_id = txn.get("ProductID", "")
+                aggregate.add(txn)
+                aggregate.add_enrichment(txn, index.enrichment(product_id))
+                product_ids[product_id] = product_ids.get(product_id, 0) + 1
+                rows_added += 1
+
+        if not rebuilt and state["catalog"] != catalog:
+            _recount_enrichment(aggregate, product_ids, index)
+        checksum = digest.hexdigest()
+
+    save_report_state({
+        "version": STATE_VERSION,
+        "path": path,
+        "offset": offset,
+        "checksum": checksum,
+        "catalog": catalog,
+        "product_ids": product_ids,
+        "aggregate": aggregate.to_state(),
+    }, state_file)
+    return aggregate, rows_added, rebuilt
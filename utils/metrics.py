@@ -0,0 +1,309 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_active = None
+_local = threading.local()
+
+
+def peak_rss_kb():
+    """Process high-water RSS in KiB, or None where resource is unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def metrics_path_for(report_file):
+    """Output/sales_report.txt -> Output/sales_report.metrics.json"""
+    return os.path.splitext(report_file)[0] + ".metrics.json"
+
+
+def _row_count(value):
+    if hasattr(value, "record_count"):
+        return value.record_count
+    if isinstance(value, (str, bytes)) or not hasattr(value, "__len__"):
+        return None
+    return len(value)
+
+
+class StageRecord:
+    """Handle yielded by stage(); callers fill in rows_in / rows_out."""
+
+    __slots__ = ("name", "rows_in", "rows_out", "child_peak")
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.child_peak = 0
+
+
+class _ErrorCounter(logging.Handler):
+    def __init__(self, metrics):
+        super().__init__(logging.WARNING)
+        self.metrics = metrics
+
+    def emit(self, record):
+        stack = getattr(_local, "stack", None)
+        name = stack[-1].name if stack else None
+        self.metrics.log_record(name, record.levelno)
+
+
+class RunMetrics:
+    """
+    Per-stage measurements of one pipeline run.
+
+    Every stage records calls, wall and CPU seconds, rows in/out, the
+    process peak RSS when it ended and the errors logged while it ran;
+    with trace_memory=True also the tracemalloc peak above the memory in
+    use when it started. Catalog requests add latency/retry/failure
+    figures. With profile_dir set, each outermost stage also writes a
+    cProfile dump (<stage>.prof) there.
+    """
+
+    def __init__(self, trace_memory=False, profile_dir=None):
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.started_at = datetime.now()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self.stages = {}
+        self.counters = {}
+        self.api_latencies = []
+        self.api_failures = 0
+        self.api_retries = 0
+        self.errors = 0
+        self.warnings = 0
+        # stage name -> errors logged while it ran (stages may still be open)
+        self.stage_errors = {}
+        self._profiling = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        record = StageRecord(name, rows_in)
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+
+        if self.trace_memory:
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, tracemalloc.get_traced_memory()[1])
+            start_traced = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        profiler = None
+        if self.profile_dir:
+            with self._lock:
+                if not self._profiling:
+                    self._profiling = True
+                    profiler = cProfile.Profile()
+        stack.append(record)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            stack.pop()
+            traced_peak = None
+            if self.trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], record.child_peak)
+                traced_peak = max(peak - start_traced, 0)
+                if stack:
+                    stack[-1].child_peak = max(stack[-1].child_peak, peak)
+            self._finish(record, wall, cpu, traced_peak, profiler)
+
+    def _finish(self, record, wall, cpu, traced_peak, profiler):
+        with self._lock:
+            stats = self.stages.get(record.name)
+            if stats is None:
+                stats = self.stages[record.name] = {
+                    "calls": 0,
+                    "wall_seconds": 0.0,
+                    "cpu_seconds": 0.0,
+                    "rows_in": None,
+                    "rows_out": None,
+                    "peak_rss_kb": None,
+                    "tracemalloc_peak_bytes": None,
+                }
+            stats["calls"] += 1
+            stats["wall_seconds"] += wall
+            stats["cpu_seconds"] += cpu
+            for key in ("rows_in", "rows_out"):
+                value = getattr(record, key)
+                if value is not None:
+                    stats[key] = (stats[key] or 0) + value
+            stats["peak_rss_kb"] = peak_rss_kb()
+            if traced_peak is not None:
+                stats["tracemalloc_peak_bytes"] = max(stats["tracemalloc_peak_bytes"] or 0, traced_peak)
+            calls = stats["calls"]
+            if profiler:
+                self._profiling = False
+
+        if profiler:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            suffix = "" if calls == 1 else f".{calls}"
+            profiler.dump_stats(os.path.join(self.profile_dir, f"{record.name}{suffix}.prof"))
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_api_call(self, seconds, ok=True, retry=False):
+        with self._lock:
+            self.api_latencies.append(seconds)
+            if not ok:
+                self.api_failures += 1
+            if retry:
+                self.api_retries += 1
+
+    def log_record(self, stage_name, level):
+        with self._lock:
+            if level >= logging.ERROR:
+                self.errors += 1
+                if stage_name is not None:
+                    self.stage_errors[stage_name] = self.stage_errors.get(stage_name, 0) + 1
+            else:
+                self.warnings += 1
+
+    def _api_summary(self):
+        latencies = sorted(self.api_latencies)
+        summary = {
+            "requests": len(latencies),
+            "failures": self.api_failures,
+            "retries": self.api_retries,
+        }
+        if latencies:
+            summary["latency_seconds"] = {
+                "total": sum(latencies),
+                "mean": sum(latencies) / len(latencies),
+                "p50": latencies[len(latencies) // 2],
+                "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "max": latencies[-1],
+            }
+        return summary
+
+    def to_dict(self):
+        with self._lock:
+            stages = {name: dict(stats) for name, stats in self.stages.items()}
+            for name, stats in stages.items():
+                stats["errors"] = self.stage_errors.get(name, 0)
+            return {
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "wall_seconds": time.perf_counter() - self._start_wall,
+                "cpu_seconds": time.process_time() - self._start_cpu,
+                "peak_rss_kb": peak_rss_kb(),
+                "errors": self.errors,
+                "warnings": self.warnings,
+                "stages": stages,
+                "api": self._api_summary(),
+                "counters": dict(self.counters),
+            }
+
+    def write(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=4)
+        return path
+
+
+@contextmanager
+def collect_metrics(metrics_file=None, trace_memory=False, profile_dir=None):
+    """
+    Makes a RunMetrics the target of every stage()/count()/record_api_call()
+    hook for the duration of the block and writes it to metrics_file (if
+    given) on the way out, even when the block raises.
+
+    Errors and warnings logged during the run are counted per stage.
+    """
+    global _active
+    metrics = RunMetrics(trace_memory, profile_dir)
+    root = logging.getLogger()
+    if not root.handlers:
+        # keep logging.error's implicit stderr output once our handler is added
+        logging.basicConfig()
+    handler = _ErrorCounter(metrics)
+    root.addHandler(handler)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    previous, _active = _active, metrics
+    try:
+        yield metrics
+    finally:
+        _active = previous
+        root.removeHandler(handler)
+        if metrics_file:
+            metrics.write(metrics_file)
+        if started_tracing:
+            tracemalloc.stop()
+
+
+@contextmanager
+def _untracked(name, rows_in=None):
+    yield StageRecord(name, rows_in)
+
+
+def stage(name, rows_in=None):
+    """
+    Context manager timing one pipeline stage of the active run; yields a
+    StageRecord whose rows_out (and rows_in) the caller may set. Without
+    an active collect_metrics() run it only costs the record allocation.
+    """
+    metrics = _active
+    if metrics is None:
+        return _untracked(name, rows_in)
+    return metrics.stage(name, rows_in)
+
+
+def instrumented(name=None):
+    """
+    Decorator running the function as a stage. rows_in / rows_out are the
+    sizes of the first argument and of the result, when they have one.
+    """
+    def decorate(fn):
+        stage_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+            rows_in = _row_count(args[0]) if args else None
+            with stage(stage_name, rows_in) as record:
+                result = fn(*args, **kwargs)
+                record.rows_out = _row_count(result)
+            return result
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    if _active is not None:
+        _active.count(name, n)
+
+
+def record_api_call(seconds, ok=True, retry=False):
+    if _active is not None:
+        _active.record_api_call(seconds, ok, retry)
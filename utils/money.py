@@ -0,0 +1,65 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+# Money is carried as integer paise (1 rupee = 100 paise) from parsing
+# through aggregation to formatting, so totals are exact at any row count.
+PAISE_PER_RUPEE = 100
+CURRENCY_SYMBOL = "₹"
+
+_ONE_PAISA = Decimal("0.01")
+
+
+def _decimal_to_paise(value):
+    return int(value.quantize(_ONE_PAISA, rounding=ROUND_HALF_UP) * PAISE_PER_RUPEE)
+
+
+def to_paise(rupees):
+    """Rupee amount (int, float, Decimal or numeric text) -> int paise."""
+    if isinstance(rupees, int):
+        return rupees * PAISE_PER_RUPEE
+    # str() of a float is its shortest repr, so 0.1 becomes exactly 10 paise
+    return _decimal_to_paise(Decimal(str(rupees).replace(",", "")))
+
+
+def safe_to_paise(val):
+    """
+    Price text -> int paise, e.g. "1,916" -> 191600 and "173.5" -> 17350.
+    Anything unparseable counts as 0.
+    """
+    try:
+        text = val.replace(",", "")
+        try:
+            return int(text) * PAISE_PER_RUPEE
+        except ValueError:
+            return _decimal_to_paise(Decimal(text))
+    except (ValueError, ArithmeticError, AttributeError):
+        return 0
+
+
+def safe_bytes_to_paise(val):
+    """safe_to_paise for raw bytes fields."""
+    try:
+        return int(val.replace(b",", b"")) * PAISE_PER_RUPEE
+    except ValueError:
+        return safe_to_paise(val.decode("ascii", "replace"))
+
+
+def divide_paise(total, count):
+    """total / count in whole paise, halves rounded away from zero; 0 for count 0."""
+    if not count:
+        return 0
+    quotient = (abs(total) * 2 + count) // (2 * count)
+    return -quotient if total < 0 else quotient
+
+
+def format_paise(paise, symbol=CURRENCY_SYMBOL):
+    """191600 -> "₹1,916.00", exact for any integer amount."""
+    sign = "-" if paise < 0 else ""
+    rupees, fraction = divmod(abs(paise), PAISE_PER_RUPEE)
+    return f"{symbol}{sign}{rupees:,}.{fraction:02d}"
+
+
+def paise_to_text(paise):
+    """Plain rupee text as in the sales files: "173" or "173.50"."""
+    sign = "-" if paise < 0 else ""
+    rupees, fraction = divmod(abs(paise), PAISE_PER_RUPEE)
+    return f"{sign}{rupees}.{fraction:02d}" if fraction else f"{sign}{rupees}"
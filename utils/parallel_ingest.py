@@ -0,0 +1,189 @@
+import glob
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from utils.aggregation import SalesAggregate
+from utils.file_handler import (
+    detect_encoding,
+    iter_clean_rows,
+    iter_mmap_transactions,
+    iter_parse_rows,
+)
+from utils.transactions import TransactionBatch
+from utils.validation import merge_rejects
+
+MIN_CHUNK_BYTES = 1 << 20
+
+
+def new_clean_counters():
+    return {"total": 0, "invalid": 0, "rejected": {}}
+
+def merge_clean_counters(target, source):
+    target["total"] += source["total"]
+    target["invalid"] += source["invalid"]
+    merge_rejects(target, source)
+
+def find_chunk_offsets(path, chunk_count):
+    """
+    Splits a pipe-delimited file into newline-aligned byte ranges.
+
+    Returns (header_line, [(start, end), ...]); the header is excluded from
+    the ranges and every range ends just after a newline (or at EOF).
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        data_start = f.tell()
+        chunk_count = max(1, min(chunk_count, (size - data_start) // MIN_CHUNK_BYTES))
+        step = (size - data_start) // chunk_count
+
+        bounds = [data_start]
+        for i in range(1, chunk_count):
+            f.seek(data_start + i * step)
+            f.readline()
+            position = min(f.tell(), size)
+            if position > bounds[-1]:
+                bounds.append(position)
+        if bounds[-1] < size:
+            bounds.append(size)
+
+    return header, list(zip(bounds, bounds[1:]))
+
+def _clean_and_parse_chunk(path, start, end, encoding, headings, keep_cleaned, compact, keep_rejects=False,
+                           parse=True):
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode(encoding)
+
+    counters = new_clean_counters()
+    rejects = io.StringIO() if keep_rejects else None
+    cleaned = list(iter_clean_rows(text.split("\n"), counters, rejects=rejects))
+    # a clean-only run ships no records back, so the parent never holds them
+    transactions = list(iter_parse_rows(cleaned, headings, compact)) if parse else []
+    # cleaned rows travel back as one string: far cheaper to pickle than lists
+    cleaned_text = "".join("|".join(row) + "\n" for row in cleaned) if keep_cleaned else ""
+    return cleaned_text, transactions, counters, rejects.getvalue() if rejects else ""
+
+def parallel_clean_and_parse(input_file, cleaned_file=None, workers=None, chunks_per_worker=4,
+                             compact=False, reject_file=None, parse=True):
+    """
+    Cleans (Q1 rules) and parses a raw sales file across a process pool.
+
+    The file is split at newline-aligned byte offsets, each chunk is cleaned
+    and parsed in a worker, and results are merged back in file order. When
+    cleaned_file is given it receives the same output handleQuestionOne
+    writes, and reject_file the rejected rows tagged with their rule.
+    Returns (TransactionBatch, counters) where counters holds the merged
+    "total"/"invalid" record counts and per-rule "rejected" counts.
+    compact=True parses into Transaction records. With parse=False the
+    chunks are only cleaned, and the batch is None.
+    """
+    workers = workers or os.cpu_count() or 1
+    encoding = detect_encoding(input_file)
+    header, ranges = find_chunk_offsets(input_file, workers * chunks_per_worker)
+    header = header.decode(encoding).strip()
+    headings = header.split("|")
+
+    args = (encoding, headings, cleaned_file is not None, compact, reject_file is not None, parse)
+    if workers == 1 or len(ranges) == 1:
+        results = [
+            _clean_and_parse_chunk(input_file, start, end, *args)
+            for start, end in ranges
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_clean_and_parse_chunk, input_file, start, end, *args)
+                for start, end in ranges
+            ]
+            results = [future.result() for future in futures]
+
+    batch = TransactionBatch()
+    counters = new_clean_counters()
+    outfile = open(cleaned_file, "w") if cleaned_file else None
+    rejectfile = open(reject_file, "w") if reject_file else None
+    try:
+        if outfile:
+            outfile.write(header + "\n")
+        if rejectfile:
+            rejectfile.write(f"Rule|{header}\n")
+        for cleaned, transactions, chunk_counters, rejected in results:
+            if outfile:
+                outfile.write(cleaned)
+            if rejectfile:
+                rejectfile.write(rejected)
+            batch.transactions.extend(transactions)
+            merge_clean_counters(counters, chunk_counters)
+    finally:
+        if outfile:
+            outfile.close()
+        if rejectfile:
+            rejectfile.close()
+
+    return (batch if parse else None), counters
+
+def resolve_input_files(source, pattern="*.txt"):
+    """
+    Sorted list of files named by source: every pattern match in a
+    directory, the matches of a glob, or a single file.
+    """
+    if os.path.isdir(source):
+        source = os.path.join(source, pattern)
+    files = sorted(path for path in glob.glob(source) if os.path.isfile(path))
+    if not files:
+        raise FileNotFoundError(f"No sales files match {source}")
+    return files
+
+def _aggregate_file(path, product_mapping=None, sketch=False):
+    """Map step: Q1 cleaning + SalesAggregate for one file, in a worker."""
+    counters = new_clean_counters()
+    aggregate = SalesAggregate(sketch=sketch)
+    transactions = iter_mmap_transactions(path, counters, clean=True, compact=True)
+    if product_mapping is None:
+        aggregate.update(transactions)
+    else:
+        from utils.api_handler import as_product_index
+
+        enrichment = as_product_index(product_mapping).enrichment
+        for txn in transactions:
+            aggregate.add(txn)
+            aggregate.add_enrichment(txn, enrichment(txn.ProductID))
+    return aggregate, counters
+
+def aggregate_files(source, workers=None, product_mapping=None, sketch=False, pattern="*.txt"):
+    """
+    Map-reduce over many raw sales files (a directory, a glob or one path),
+    e.g. per-store daily drops.
+
+    Each file is cleaned with the Q1 rules and aggregated in its own worker
+    process; the partial SalesAggregates come back in file order and are
+    merged (SalesAggregate.merge) into one, so the result equals
+    aggregating all files' cleaned rows in sequence. Files are independent,
+    so throughput grows with workers until disk bandwidth is the limit.
+    With product_mapping the enrichment summary is accumulated as well.
+
+    Returns (SalesAggregate, counters) with the merged "total"/"invalid"
+    record counts, per-rule "rejected" counts and a "files" count.
+    """
+    files = resolve_input_files(source, pattern)
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    work = partial(_aggregate_file, product_mapping=product_mapping, sketch=sketch)
+
+    aggregate = SalesAggregate(sketch=sketch)
+    counters = new_clean_counters()
+    counters["files"] = len(files)
+
+    def reduce(results):
+        for partial_aggregate, file_counters in results:
+            aggregate.merge(partial_aggregate)
+            merge_clean_counters(counters, file_counters)
+
+    if workers == 1:
+        reduce(map(work, files))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # small files travel in groups to keep per-task overhead down
+            reduce(pool.map(work, files, chunksize=max(1, len(files) // (workers * 4))))
+    return aggregate, counters
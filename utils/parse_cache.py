@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+from utils.metrics import count
+
+PARSE_CACHE_ENTRIES = 4
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def content_digest(path):
+    """blake2b hex digest of the whole file."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    Memo of parsed files keyed by their fingerprint.
+
+    A file is identified by (path, size, mtime_ns) and its content hash:
+    while the stat triple is unchanged the cached batch is returned without
+    opening the file; when it changes the content is rehashed, so a file
+    rewritten with identical bytes (e.g. the cleaned file on every Q1 run)
+    is still a hit. Up to max_entries parsed batches are kept in memory,
+    least recently used evicted first. With cache_dir set, batches are also
+    pickled there by content hash so later runs skip parsing; only point it
+    at a directory you trust, since the entries are unpickled.
+
+    Cached batches are shared between callers and must not be modified.
+    """
+
+    def __init__(self, max_entries=PARSE_CACHE_ENTRIES, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        # (path, variant) -> (size, mtime_ns, digest, batch)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def disk_path(self, digest, variant):
+        return os.path.join(self.cache_dir, f"{digest}{'.' + variant if variant else ''}.pickle")
+
+    def get(self, path, parse, variant=""):
+        """
+        Returns the parsed batch for path, calling parse(path) only when
+        neither the memory nor the disk cache holds the current content.
+        variant separates differently parsed forms of the same file.
+        """
+        key = (os.path.abspath(path), variant)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                self._entries.move_to_end(key)
+                count("parse_cache.memory_hit")
+                return entry[3]
+
+        digest = content_digest(path)
+        if entry and entry[2] == digest:
+            batch = entry[3]
+            count("parse_cache.memory_hit")
+        else:
+            batch = self._load(digest, variant)
+            if batch is not None:
+                count("parse_cache.disk_hit")
+            else:
+                count("parse_cache.miss")
+                batch = parse(path)
+                self._store(digest, variant, batch)
+
+        with self._lock:
+            self._entries[key] = (stat.st_size, stat.st_mtime_ns, digest, batch)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return batch
+
+    def _load(self, digest, variant):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self.disk_path(digest, variant), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error("Unreadable parse cache entry", exc_info=e)
+            return None
+
+    def _store(self, digest, variant, batch):
+        if not self.cache_dir or batch is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.disk_path(digest, variant))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+# process-wide memo used by main.parse_transactions
+PARSE_CACHE = ParseCache()
@@ -0,0 +1,124 @@
+import copy
+from array import array
+from bisect import bisect_left, bisect_right
+
+from utils.data_processor import new_filter_summary
+from utils.money import to_paise
+from utils.transactions import as_batch
+from utils.validation import VALIDITY_RULES
+
+
+class _Partition:
+    """Valid rows of one region (or of all regions), sorted by amount in paise."""
+
+    __slots__ = ("amounts", "positions")
+
+    def __init__(self, amounts, positions):
+        order = sorted(range(len(amounts)), key=amounts.__getitem__)
+        self.amounts = array("q", (amounts[i] for i in order))
+        self.positions = array("q", (positions[i] for i in order))
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def range(self, min_amount=None, max_amount=None):
+        lo = bisect_left(self.amounts, min_amount) if min_amount is not None else 0
+        hi = bisect_right(self.amounts, max_amount) if max_amount is not None else len(self.amounts)
+        return lo, max(lo, hi)
+
+
+class TransactionIndex:
+    """
+    Prebuilt query index for repeated validate_and_filter calls over the
+    same transactions.
+
+    Rows failing the validity rules (utils.validation.VALIDITY_RULES) are
+    counted once at build time; valid rows are kept per region and overall, each
+    partition sorted by amount (Quantity * UnitPrice, int paise) so an
+    amount range (given in rupees) is two bisects. query() returns exactly what iter_validate_and_filter
+    yields, in the original order, with the same filter_summary counters,
+    but costs O(log n + k log k) for k matching rows instead of O(n).
+    """
+
+    def __init__(self, transactions):
+        self.transactions = as_batch(transactions).transactions
+        self.invalid = 0
+        self.rejected = {}
+        check = VALIDITY_RULES.predicate("record")
+        amounts = []
+        positions = []
+        by_region = {}
+        for position, txn in enumerate(self.transactions):
+            failed = check(txn)
+            if failed is not None:
+                self.invalid += 1
+                self.rejected[failed] = self.rejected.get(failed, 0) + 1
+                continue
+            amount = txn.get("Quantity", 0) * txn.get("UnitPrice", 0)
+            amounts.append(amount)
+            positions.append(position)
+            region = by_region.get(txn.get("Region"))
+            if region is None:
+                region = by_region[txn.get("Region")] = ([], [])
+            region[0].append(amount)
+            region[1].append(position)
+
+        self.all = _Partition(amounts, positions)
+        self.regions = {
+            region: _Partition(region_amounts, region_positions)
+            for region, (region_amounts, region_positions) in by_region.items()
+        }
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def __repr__(self):
+        return f"TransactionIndex({len(self.transactions)} transactions, {len(self.regions)} regions)"
+
+    def __getstate__(self):
+        # pickled without its rows (the parse cache holds those); bind() them back
+        state = dict(self.__dict__)
+        state["transactions"] = None
+        return state
+
+    def bind(self, transactions):
+        """Copy of this index over transactions, the rows it was built from."""
+        index = copy.copy(self)
+        index.transactions = as_batch(transactions).transactions
+        return index
+
+    def count(self, region=None, min_amount=None, max_amount=None):
+        """filter_summary for a query, without materialising the rows."""
+        return self._query(region, min_amount, max_amount)[1]
+
+    def query(self, region=None, min_amount=None, max_amount=None):
+        """Returns: (matching transactions in original order, filter_summary)"""
+        (partition, lo, hi), filter_summary = self._query(region, min_amount, max_amount)
+        if partition is None:
+            return [], filter_summary
+        transactions = self.transactions
+        return [transactions[p] for p in sorted(partition.positions[lo:hi])], filter_summary
+
+    def _query(self, region, min_amount, max_amount):
+        filter_summary = new_filter_summary()
+        filter_summary["total_input"] = len(self.transactions)
+        filter_summary["invalid"] = self.invalid
+        filter_summary["rejected"] = dict(self.rejected)
+        valid = len(self.all)
+
+        if region:
+            partition = self.regions.get(region)
+            in_region = len(partition) if partition is not None else 0
+            filter_summary["filtered_by_region"] = valid - in_region
+        else:
+            partition = self.all
+        if partition is None:
+            return (None, 0, 0), filter_summary
+
+        lo, hi = partition.range(
+            to_paise(min_amount) if min_amount is not None else None,
+            to_paise(max_amount) if max_amount is not None else None,
+        )
+        filter_summary["filtered_by_amount"] = len(partition) - (hi - lo)
+        filter_summary["final_count"] = hi - lo
+        return (partition, lo, hi), filter_summary
@@ -0,0 +1,172 @@
+from datetime import date
+from functools import lru_cache
+
+from utils.data_processor import aggregate_sales, top_k
+from utils.transactions import as_batch
+
+PERIODS = ("day", "week", "month", "quarter")
+DIMENSIONS = ("period", "region", "product", "segment")
+
+# (share of customers, segment) from the biggest spenders down; the rest are "low"
+SPEND_SEGMENTS = ((0.2, "high"), (0.3, "mid"))
+UNKNOWN_SEGMENT = "unknown"
+
+
+@lru_cache(maxsize=8192)
+def period_key(iso_date, period="day"):
+    """
+    Bucket label of an ISO date: 2024-12-05 (day), 2024-W49 (ISO week),
+    2024-12 (month) or 2024-Q4 (quarter). Labels sort chronologically.
+    """
+    if period == "day":
+        return iso_date
+    day = date.fromisoformat(iso_date)
+    if period == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == "month":
+        return f"{day.year}-{day.month:02d}"
+    if period == "quarter":
+        return f"{day.year}-Q{(day.month - 1) // 3 + 1}"
+    raise ValueError(f"Unknown period {period!r}; expected one of {', '.join(PERIODS)}")
+
+
+def customer_segments(transactions, tiers=SPEND_SEGMENTS):
+    """
+    Spend tier of every customer: the top 20% by total spend are "high",
+    the next 30% "mid" and everyone else "low".
+
+    Returns: dict of customer_id -> segment
+    """
+    ranked = top_k(
+        aggregate_sales(transactions).customers.items(), None,
+        key=lambda item: item[1]["total_spent"],
+    )
+    segments = {}
+    start = 0
+    for share, segment in tiers:
+        end = start + round(len(ranked) * share)
+        for customer_id, _ in ranked[start:end]:
+            segments[customer_id] = segment
+        start = end
+    for customer_id, _ in ranked[start:]:
+        segments[customer_id] = "low"
+    return segments
+
+
+class SalesCube:
+    """
+    Pre-aggregated sales at date x region x product x customer-segment grain.
+
+    Each cell holds [revenue, quantity, transaction_count], all additive,
+    so any coarser breakdown (week/month/quarter, region x product x period,
+    a single slice) is a sum over cells and never rereads transactions.
+    The cube is as big as the number of distinct cells, not of rows.
+    Distinct customer counts do not add up across cells and stay with
+    SalesAggregate / daily_sales_trend.
+    """
+
+    def __init__(self, segments=None):
+        # customer_id -> segment; unknown ids fall into UNKNOWN_SEGMENT
+        self.segments = segments or {}
+        # (date, region, product, segment) -> [revenue, quantity, transaction_count]
+        self.cells = {}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __repr__(self):
+        return f"SalesCube({len(self.cells)} cells)"
+
+    def add(self, txn):
+        day = (txn.get("Date") or "").strip()
+        if not day:
+            return
+        quantity = txn.get("Quantity", 0)
+        customer_id = (txn.get("CustomerID") or "").strip()
+        key = (
+            day,
+            txn.get("Region") or "",
+            (txn.get("ProductName") or "").strip(),
+            self.segments.get(customer_id, UNKNOWN_SEGMENT),
+        )
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = [0, 0, 0]
+        cell[0] += quantity * txn.get("UnitPrice", 0)
+        cell[1] += quantity
+        cell[2] += 1
+
+    def update(self, transactions):
+        add = self.add
+        for txn in transactions:
+            add(txn)
+        return self
+
+    def rollup(self, by=("period",), period="day", region=None, product=None, segment=None,
+               start=None, end=None):
+        """
+        Sums the cells matching the filters, grouped by the dimensions in by
+        (any of DIMENSIONS, in that order of keys). start / end bound the
+        ISO date inclusively.
+
+        Returns: dict of key -> {"revenue", "quantity", "transaction_count"},
+        sorted by key; the key is a tuple unless by names one dimension.
+        """
+        unknown = [name for name in by if name not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown dimension(s) {unknown}; expected any of {', '.join(DIMENSIONS)}")
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period {period!r}; expected one of {', '.join(PERIODS)}")
+
+        groups = {}
+        for (day, cell_region, cell_product, cell_segment), (revenue, quantity, count) in self.cells.items():
+            if region is not None and cell_region != region:
+                continue
+            if product is not None and cell_product != product:
+                continue
+            if segment is not None and cell_segment != segment:
+                continue
+            if (start is not None and day < start) or (end is not None and day > end):
+                continue
+            values = {
+                "period": period_key(day, period),
+                "region": cell_region,
+                "product": cell_product,
+                "segment": cell_segment,
+            }
+            key = tuple(values[name] for name in by)
+            if len(key) == 1:
+                key = key[0]
+            stats = groups.get(key)
+            if stats is None:
+                stats = groups[key] = {"revenue": 0, "quantity": 0, "transaction_count": 0}
+            stats["revenue"] += revenue
+            stats["quantity"] += quantity
+            stats["transaction_count"] += count
+        return dict(sorted(groups.items(), key=lambda item: item[0]))
+
+    def trend(self, period="day", **filters):
+        """Revenue/quantity/transactions per period, oldest first."""
+        return self.rollup(("period",), period, **filters)
+
+    def peak_periods(self, period="day", k=1, **filters):
+        """
+        Top k periods by revenue, ties to the earlier period.
+
+        Returns: list of (period, revenue, transaction_count) tuples
+        """
+        ranked = top_k(self.trend(period, **filters).items(), k, key=lambda item: item[1]["revenue"])
+        return [(key, stats["revenue"], stats["transaction_count"]) for key, stats in ranked]
+
+
+def build_sales_cube(transactions, segments=None):
+    """
+    Builds a SalesCube over transactions. Without an explicit
+    customer_id -> segment mapping, customers are split into spend tiers
+    (see customer_segments), which costs one extra aggregation pass.
+    """
+    batch = as_batch(transactions)
+    if segments is None:
+        segments = customer_segments(batch)
+    return SalesCube(segments).update(batch)
@@ -0,0 +1,373 @@
+"""
+Optional SQLite store of parsed (and enriched) transactions.
+
+Transactions are bulk-loaded once (batched executemany inside a single
+transaction, indexes built after the load) into a local database file,
+with Date, Region, ProductID and CustomerID indexed. The functions below
+are SQL counterparts of the metric functions in utils.data_processor and
+of main.validate_and_filter; they return identical results, including
+tie ordering (ties go to the first-seen key, i.e. the lowest rowid).
+Keys are grouped as stored, which matches the stripped keys of
+SalesAggregate for parsed files (their fields carry no padding). Money
+is stored as int paise like everywhere else.
+
+open_sales_store() keeps a store in step with a cleaned file: it is
+reloaded only when the file's content changes, so repeated reports and
+ad-hoc questions query the indexes instead of rescanning the text. It
+loads the bare parsed rows; store_enriched() replaces them with the
+enriched rows of the same file, whose API_* columns are then kept until
+the file changes.
+"""
+import json
+import logging
+import os
+import sqlite3
+from operator import attrgetter
+
+from utils.aggregation import REGIONS
+from utils.data_processor import new_filter_summary
+from utils.money import divide_paise, to_paise
+from utils.parse_cache import content_digest
+from utils.transactions import ENRICHMENT_FIELDS, TRANSACTION_FIELDS, Transaction, TransactionBatch
+from utils.validation import VALIDITY_RULES
+
+SALES_STORE_FILE = "./Output/sales.sqlite3"
+BULK_BATCH_ROWS = 50_000
+
+COLUMNS = TRANSACTION_FIELDS + ("Amount",) + ENRICHMENT_FIELDS
+
+_transaction_fields = attrgetter(*TRANSACTION_FIELDS)
+_NOT_ENRICHED = (None,) * len(ENRICHMENT_FIELDS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    TransactionID TEXT,
+    Date TEXT,
+    ProductID TEXT,
+    ProductName TEXT,
+    Quantity INTEGER,
+    UnitPrice INTEGER,
+    CustomerID TEXT,
+    Region TEXT,
+    Amount INTEGER,
+    API_Category TEXT,
+    API_Brand TEXT,
+    API_Rating REAL,
+    API_Match INTEGER
+);
+CREATE TABLE IF NOT EXISTS source (
+    path TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    digest TEXT
+);
+"""
+
+INDEXES = {
+    "transactions_date": "Date",
+    "transactions_region": "Region, Amount",
+    "transactions_product": "ProductID",
+    "transactions_customer": "CustomerID",
+}
+
+
+def _rule_condition(rule):
+    """SQL condition a row must meet to pass one validation rule."""
+    column = rule.field
+    if rule.check == "prefix":
+        return f"substr(coalesce({column}, ''), 1, {len(rule.argument)}) = '{rule.argument}'"
+    if rule.check == "min":
+        return f"coalesce({column}, 0) >= {rule.argument!r}"
+    if rule.check == "gt":
+        return f"coalesce({column}, 0) > {rule.argument!r}"
+    # stored columns are already typed, so "parses" always holds
+    return "1"
+
+def _failed_rule_sql(rules):
+    """CASE expression naming the first rule a row breaks (NULL if none)."""
+    cases = " ".join(
+        f"WHEN NOT ({_rule_condition(rule)}) THEN '{rule.name}'" for rule in rules.rules
+    )
+    return f"CASE {cases} END" if cases else "NULL"
+
+
+class SalesStore:
+    def __init__(self, path=SALES_STORE_FILE):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    def __repr__(self):
+        return f"SalesStore({self.path!r}, {len(self)} transactions)"
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load(self, transactions, batch_rows=BULK_BATCH_ROWS):
+        """
+        Replaces the stored transactions (any iterable of records; enriched
+        rows keep their API_* columns) in one transaction.
+
+        Indexes are dropped for the load and rebuilt afterwards, which is
+        much faster than maintaining them row by row.
+        """
+        def rows():
+            for txn in transactions:
+                if type(txn) is Transaction:
+                    # compact records: one attrgetter call instead of a get() per field
+                    row = _transaction_fields(txn)
+                    yield row + (row[4] * row[5],) + _NOT_ENRICHED
+                    continue
+                quantity = txn.get("Quantity", 0)
+                unit_price = txn.get("UnitPrice", 0)
+                match = txn.get("API_Match")
+                yield (
+                    txn.get("TransactionID"), txn.get("Date"), txn.get("ProductID"),
+                    txn.get("ProductName"), quantity, unit_price, txn.get("CustomerID"),
+                    txn.get("Region"), quantity * unit_price, txn.get("API_Category"),
+                    txn.get("API_Brand"), txn.get("API_Rating"),
+                    None if match is None else int(match),
+                )
+
+        insert = f"INSERT INTO transactions VALUES ({', '.join('?' * len(COLUMNS))})"
+        connection = self.connection
+        connection.execute("PRAGMA synchronous = OFF")
+        try:
+            with connection:
+                for name in INDEXES:
+                    connection.execute(f"DROP INDEX IF EXISTS {name}")
+                connection.execute("DELETE FROM transactions")
+                connection.execute("DELETE FROM source")
+                batch = []
+                for row in rows():
+                    batch.append(row)
+                    if len(batch) >= batch_rows:
+                        connection.executemany(insert, batch)
+                        batch = []
+                if batch:
+                    connection.executemany(insert, batch)
+                for name, columns in INDEXES.items():
+                    connection.execute(f"CREATE INDEX {name} ON transactions ({columns})")
+            connection.execute("ANALYZE")
+        finally:
+            connection.execute("PRAGMA synchronous = FULL")
+        return self
+
+    def source(self):
+        """(path, size, mtime_ns, digest) of the file last loaded, or None."""
+        return self.connection.execute("SELECT path, size, mtime_ns, digest FROM source").fetchone()
+
+    def set_source(self, path, digest):
+        stat = os.stat(path)
+        with self.connection:
+            self.connection.execute("DELETE FROM source")
+            self.connection.execute(
+                "INSERT INTO source VALUES (?, ?, ?, ?)",
+                (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, digest),
+            )
+
+    def query(self, sql, parameters=()):
+        """Ad-hoc read query; returns a list of row tuples."""
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def records(self, where="1", parameters=()):
+        """Stored transactions as dicts, in load order."""
+        rows = self.connection.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM transactions WHERE {where} ORDER BY rowid",
+            parameters,
+        )
+        base = len(TRANSACTION_FIELDS)
+        out = []
+        for row in rows:
+            record = dict(zip(TRANSACTION_FIELDS, row))
+            if row[-1] is not None:
+                record.update(zip(ENRICHMENT_FIELDS, row[base + 1:]))
+                record["API_Match"] = bool(record["API_Match"])
+            out.append(record)
+        return out
+
+
+def open_sales_store(path, source_file, parse):
+    """
+    SalesStore at path holding source_file's transactions.
+
+    The store records the (size, mtime_ns, content hash) of the file it
+    was loaded from; when the file changed, parse(source_file) is loaded
+    in its place. A rewrite with identical bytes only refreshes the stat.
+    """
+    store = SalesStore(path)
+    stat = os.stat(source_file)
+    loaded = store.source()
+    if loaded is not None and loaded[0] == os.path.abspath(source_file):
+        if loaded[1:3] == (stat.st_size, stat.st_mtime_ns):
+            return store
+        digest = content_digest(source_file)
+        if loaded[3] == digest:
+            store.set_source(source_file, digest)
+            return store
+    else:
+        digest = content_digest(source_file)
+    store.load(parse(source_file))
+    store.set_source(source_file, digest)
+    return store
+
+def store_enriched(store, source_file, enriched):
+    """
+    Reloads store with the enriched rows of source_file (every row, in file
+    order) so its API_* columns are filled; open_sales_store keeps them
+    for as long as source_file is unchanged.
+    """
+    store.load(enriched)
+    store.set_source(source_file, content_digest(source_file))
+    return store
+
+
+def calculate_total_revenue(store):
+    return store.connection.execute("SELECT coalesce(SUM(Amount), 0) FROM transactions").fetchone()[0]
+
+def region_wise_sale(store, as_json=True):
+    total_sales = calculate_total_revenue(store)
+    rows = store.connection.execute(
+        "SELECT Region, COUNT(*), SUM(Amount) FROM transactions"
+        " WHERE Region <> '' GROUP BY Region ORDER BY MIN(rowid)"
+    ).fetchall()
+
+    # fixed regions first, as SalesAggregate does, so ties keep that order
+    stats = {region: (0, 0) for region in REGIONS}
+    for region, count, sales in rows:
+        stats[region] = (count, sales)
+    if total_sales == 0:
+        # data_processor.region_wise_sale logs and returns the regions
+        # without percentages when there are no sales to split
+        logging.error("region_wise_sale: no sales to split by region")
+        return {
+            region: {"transaction_count": count, "total_sales": sales}
+            for region, (count, sales) in stats.items()
+        }
+    out = {
+        region: {
+            "transaction_count": count,
+            "total_sales": sales,
+            "percentage": round(sales / total_sales * 100, 2),
+        }
+        for region, (count, sales) in stats.items()
+    }
+    out = dict(sorted(out.items(), key=lambda item: item[1]["total_sales"], reverse=True))
+    return json.dumps(out, indent=4) if as_json else out
+
+def _product_rows(store, order, limit=None, having=""):
+    sql = (
+        "SELECT ProductName, SUM(Quantity) AS total_quantity, SUM(Amount) AS total_revenue"
+        " FROM transactions WHERE ProductName <> ''"
+        f" GROUP BY ProductName {having} ORDER BY {order}"
+    )
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return store.connection.execute(sql).fetchall()
+
+def top_selling_products(store, n=5):
+    """
+    Finds top n products by total quantity sold
+
+    Returns: list of tuples
+    """
+    return _product_rows(store, "total_quantity DESC, MIN(rowid)", n)
+
+def customer_analysis(store, as_json=True, n=None):
+    connection = store.connection
+    sql = (
+        "SELECT CustomerID, SUM(Amount) AS spent, COUNT(*) FROM transactions"
+        " WHERE CustomerID <> '' GROUP BY CustomerID ORDER BY spent DESC, MIN(rowid)"
+    )
+    if n is not None:
+        sql += f" LIMIT {int(n)}"
+    customers = connection.execute(sql).fetchall()
+
+    # distinct products per customer, in first-purchase order
+    products = {}
+    for customer_id, product in connection.execute(
+        "SELECT CustomerID, ProductName FROM transactions"
+        " WHERE CustomerID <> '' AND ProductName <> ''"
+        " GROUP BY CustomerID, ProductName ORDER BY MIN(rowid)"
+    ):
+        products.setdefault(customer_id, []).append(product)
+
+    out = {
+        customer_id: {
+            "total_spent": spent,
+            "purchase_count": purchase_count,
+            "products_bought": products.get(customer_id, []),
+            "avg_order_value": divide_paise(spent, purchase_count),
+        }
+        for customer_id, spent, purchase_count in customers
+    }
+    return json.dumps(out, indent=4) if as_json else out
+
+def daily_sales_trend(store, as_json=True):
+    rows = store.connection.execute(
+        "SELECT Date, SUM(Amount), COUNT(*), COUNT(DISTINCT nullif(CustomerID, ''))"
+        " FROM transactions WHERE Date <> '' GROUP BY Date ORDER BY Date"
+    )
+    out = {
+        date: {"revenue": revenue, "transaction_count": count, "unique_customers": customers}
+        for date, revenue, count, customers in rows
+    }
+    return json.dumps(out, indent=4) if as_json else out
+
+def find_peak_sales_day(store):
+    return store.connection.execute(
+        "SELECT Date, SUM(Amount) AS revenue, COUNT(*) FROM transactions"
+        " WHERE Date <> '' GROUP BY Date ORDER BY revenue DESC, MIN(rowid) LIMIT 1"
+    ).fetchone()
+
+def low_performing_products(store, threshold=10):
+    return _product_rows(store, "total_quantity, MIN(rowid)", having=f"HAVING total_quantity < {int(threshold)}")
+
+def validate_and_filter(store, region=None, min_amount=None, max_amount=None, rules=VALIDITY_RULES):
+    """
+    main.validate_and_filter as indexed queries: returns (TransactionBatch,
+    invalid_count, filter_summary) with the same rows, in load order, and
+    the same counters. min_amount and max_amount are in rupees.
+    """
+    connection = store.connection
+    failed = _failed_rule_sql(rules)
+    filter_summary = new_filter_summary()
+    filter_summary["total_input"] = len(store)
+    for rule, count in connection.execute(
+        f"SELECT {failed} AS rule, COUNT(*) FROM transactions"
+        " GROUP BY rule HAVING rule IS NOT NULL ORDER BY MIN(rowid)"
+    ):
+        filter_summary["rejected"][rule] = count
+        filter_summary["invalid"] += count
+    valid = filter_summary["total_input"] - filter_summary["invalid"]
+
+    where, parameters = [f"{failed} IS NULL"], []
+    if region:
+        where.append("Region = ?")
+        parameters.append(region)
+    in_region = connection.execute(
+        f"SELECT COUNT(*) FROM transactions WHERE {' AND '.join(where)}", parameters
+    ).fetchone()[0]
+    filter_summary["filtered_by_region"] = valid - in_region
+
+    if min_amount is not None:
+        where.append("Amount >= ?")
+        parameters.append(to_paise(min_amount))
+    if max_amount is not None:
+        where.append("Amount <= ?")
+        parameters.append(to_paise(max_amount))
+    transactions = TransactionBatch(store.records(" AND ".join(where), parameters))
+    filter_summary["final_count"] = len(transactions)
+    filter_summary["filtered_by_amount"] = in_region - len(transactions)
+    return (transactions, filter_summary["invalid"], filter_summary)
@@ -0,0 +1,169 @@
+import base64
+import hashlib
+import math
+
+DEFAULT_HLL_PRECISION = 12
+DEFAULT_TOP_K = 10
+
+
+def hash64(value):
+    """Stable 64-bit hash (unlike hash(), identical across processes)."""
+    return int.from_bytes(
+        hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big"
+    )
+
+
+class HyperLogLog:
+    """
+    Approximate distinct counter using 2**precision one-byte registers.
+
+    The relative standard error of len() is 1.04 / sqrt(2**precision),
+    about 1.6% at the default precision of 12 (4 KiB per counter).
+    It exposes add() and len() like a set, so it can stand in for one.
+    """
+
+    def __init__(self, precision=DEFAULT_HLL_PRECISION):
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        x = hash64(value)
+        bits = 64 - self.precision
+        index = x >> bits
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog counters of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / math.fsum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # small-range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return estimate
+
+    def __len__(self):
+        return int(round(self.estimate()))
+
+    def to_state(self):
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(bytes(self.registers)).decode("ascii"),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state["precision"])
+        sketch.registers = bytearray(base64.b64decode(state["registers"]))
+        return sketch
+
+
+class SpaceSaving:
+    """
+    Bounded top-k frequency summary (Space-Saving algorithm).
+
+    At most capacity items are tracked. An item that evicts the current
+    minimum inherits its count as error, so each reported count
+    overestimates the true count by at most that item's error. Any item
+    whose true count exceeds total / capacity is guaranteed to be kept.
+    Iterating yields tracked items, most frequent first.
+
+    Counts are a flat item -> count dict; errors only exist once an
+    eviction has happened, so a summary that never overflowed costs
+    little more than the dict itself.
+    """
+
+    __slots__ = ("capacity", "total", "counts", "errors")
+
+    def __init__(self, capacity=DEFAULT_TOP_K):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        # item -> max overestimate, None until the first eviction
+        self.errors = None
+
+    @classmethod
+    def from_counts(cls, counts, capacity=DEFAULT_TOP_K):
+        """Summary of exact item -> count pairs; only the top capacity are kept."""
+        summary = cls(capacity)
+        summary.total = sum(counts.values())
+        if len(counts) > capacity:
+            counts = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:capacity]
+        summary.counts = dict(counts)
+        return summary
+
+    def add(self, item, count=1):
+        self.total += count
+        counts = self.counts
+        current = counts.get(item)
+        if current is not None:
+            counts[item] = current + count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+        else:
+            victim = min(counts, key=counts.__getitem__)
+            floor = counts.pop(victim)
+            if self.errors is None:
+                self.errors = {}
+            self.errors.pop(victim, None)
+            self.errors[item] = floor
+            counts[item] = floor + count
+        return self
+
+    def error(self, item):
+        return self.errors.get(item, 0) if self.errors else 0
+
+    def merge(self, other):
+        combined = dict(self.counts)
+        errors = dict(self.errors or ())
+        for item, count in other.counts.items():
+            combined[item] = combined.get(item, 0) + count
+            error = other.error(item)
+            if error:
+                errors[item] = errors.get(item, 0) + error
+        self.total += other.total
+        ranked = sorted(combined.items(), key=lambda item: item[1], reverse=True)
+        self.counts = dict(ranked[: self.capacity])
+        errors = {item: errors[item] for item in self.counts if item in errors}
+        self.errors = errors or None
+        return self
+
+    def top(self):
+        """Returns: list of (item, count, max_overestimate) tuples"""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return [(item, count, self.error(item)) for item, count in ranked]
+
+    def __iter__(self):
+        return (item for item, _, _ in self.top())
+
+    def __len__(self):
+        return len(self.counts)
+
+    def to_state(self):
+        return {
+            "capacity": self.capacity,
+            "total": self.total,
+            "counts": [[item, count, error] for item, count, error in self.top()],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        summary = cls(state["capacity"])
+        summary.total = state["total"]
+        summary.counts = {item: count for item, count, _ in state["counts"]}
+        summary.errors = {item: error for item, _, error in state["counts"] if error} or None
+        return summary
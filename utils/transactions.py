@@ -0,0 +1,204 @@
+import json
+from collections.abc import Mapping
+from datetime import date
+from functools import lru_cache
+
+# column order of the cleaned pipe-delimited file and of every parsed record
+TRANSACTION_FIELDS = (
+    "TransactionID", "Date", "ProductID", "ProductName",
+    "Quantity", "UnitPrice", "CustomerID", "Region",
+)
+
+# columns added by api_handler.enrich_sales_data
+ENRICHMENT_FIELDS = ("API_Category", "API_Brand", "API_Rating", "API_Match")
+
+_FIELD_SET = frozenset(TRANSACTION_FIELDS)
+_ENRICHMENT_SET = frozenset(ENRICHMENT_FIELDS)
+
+
+@lru_cache(maxsize=8192)
+def iso_date_from_ordinal(ordinal):
+    return date.fromordinal(ordinal).isoformat()
+
+
+class Transaction(Mapping):
+    """
+    Compact, read-only transaction record.
+
+    A slotted object instead of a per-row dict: categorical fields are
+    expected to be interned strings shared across rows and the date is
+    stored as a day ordinal. It is a Mapping over TRANSACTION_FIELDS
+    (Date comes back as an ISO string), so every consumer that reads
+    records through txn["Field"] / txn.get("Field") accepts it unchanged.
+    """
+
+    __slots__ = (
+        "TransactionID", "date_ordinal", "ProductID", "ProductName",
+        "Quantity", "UnitPrice", "CustomerID", "Region",
+    )
+
+    def __init__(self, TransactionID, date_ordinal, ProductID, ProductName,
+                 Quantity, UnitPrice, CustomerID, Region):
+        self.TransactionID = TransactionID
+        self.date_ordinal = date_ordinal
+        self.ProductID = ProductID
+        self.ProductName = ProductName
+        self.Quantity = Quantity
+        self.UnitPrice = UnitPrice
+        self.CustomerID = CustomerID
+        self.Region = Region
+
+    @property
+    def Date(self):
+        return iso_date_from_ordinal(self.date_ordinal)
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in _FIELD_SET else default
+
+    def __iter__(self):
+        return iter(TRANSACTION_FIELDS)
+
+    def __len__(self):
+        return len(TRANSACTION_FIELDS)
+
+    def __repr__(self):
+        return f"Transaction({dict(self)!r})"
+
+    def copy(self):
+        return dict(self)
+
+    def __reduce__(self):
+        # positional rebuild unpickles ~3x faster than the default slots state;
+        # shared (interned) strings stay shared through the pickle memo
+        return (Transaction, tuple(getattr(self, name) for name in self.__slots__))
+
+
+class TransactionBatch:
+    """
+    In-memory batch of parsed transactions handed between pipeline stages.
+
+    Records are dicts keyed by TRANSACTION_FIELDS (plus ENRICHMENT_FIELDS
+    once enriched) with Quantity as int and UnitPrice as int paise. Stages pass
+    the batch itself; JSON is only produced on request through to_json().
+    """
+
+    def __init__(self, transactions=None):
+        self.transactions = list(transactions) if transactions is not None else []
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def __iter__(self):
+        return iter(self.transactions)
+
+    def __getitem__(self, index):
+        return self.transactions[index]
+
+    def __repr__(self):
+        return f"TransactionBatch({len(self.transactions)} transactions)"
+
+    def append(self, transaction):
+        self.transactions.append(transaction)
+
+    def to_json(self, indent=4):
+        # compact Transaction records serialise as plain dicts
+        return json.dumps(self.transactions, indent=indent, default=dict)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls(json.loads(text))
+
+
+class EnrichedRow(Mapping):
+    """
+    Read-only view of a base transaction plus its catalog enrichment.
+
+    ENRICHMENT_FIELDS are answered from the enrichment mapping and every
+    other key from the base row, each with a single lookup, so reading an
+    enriched row costs about the same as reading the base record.
+    """
+
+    __slots__ = ("transaction", "enrichment")
+
+    def __init__(self, enrichment, transaction):
+        self.enrichment = enrichment
+        self.transaction = transaction
+
+    def __getitem__(self, key):
+        if key in _ENRICHMENT_SET:
+            return self.enrichment[key]
+        return self.transaction[key]
+
+    def get(self, key, default=None):
+        if key in _ENRICHMENT_SET:
+            return self.enrichment.get(key, default)
+        return self.transaction.get(key, default)
+
+    def __iter__(self):
+        for key in self.transaction:
+            if key not in _ENRICHMENT_SET:
+                yield key
+        yield from ENRICHMENT_FIELDS
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"EnrichedRow({dict(self)!r})"
+
+
+class EnrichedBatch:
+    """
+    A TransactionBatch joined with product catalog slots.
+
+    Rows are read-only EnrichedRow views of (catalog[slot], base
+    transaction), so the enrichment columns are attached without copying
+    base records. iter_pairs() hands out (transaction, enrichment) without
+    building the views at all.
+    """
+
+    def __init__(self, transactions, slots, catalog):
+        self.transactions = transactions
+        self.slots = slots
+        self.catalog = catalog
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        catalog = self.catalog
+        for txn, slot in zip(self.transactions, self.slots):
+            yield EnrichedRow(catalog[slot], txn)
+
+    def iter_pairs(self):
+        catalog = self.catalog
+        for txn, slot in zip(self.transactions, self.slots):
+            yield txn, catalog[slot]
+
+    def __getitem__(self, index):
+        return EnrichedRow(self.catalog[self.slots[index]], self.transactions[index])
+
+    def __repr__(self):
+        return f"EnrichedBatch({len(self.slots)} transactions)"
+
+    def to_json(self, indent=4):
+        return json.dumps([dict(row) for row in self], indent=indent)
+
+
+def as_batch(transactions):
+    """
+    Returns transactions as a TransactionBatch.
+
+    Batches pass through untouched; JSON strings from older callers are
+    decoded once and any other iterable of records is wrapped.
+    """
+    if isinstance(transactions, TransactionBatch):
+        return transactions
+    if isinstance(transactions, str):
+        return TransactionBatch.from_json(transactions)
+    return TransactionBatch(transactions)
@@ -0,0 +1,171 @@
+"""
+Declarative row validation.
+
+Rules are declared once as data (field, check, argument) and a RuleSet
+compiles them into a single generated predicate per input form: split
+text rows, split bytes rows (the mmap reader) or parsed records. The
+predicate returns the name of the first rule a row breaks, or None, so
+callers can count rejects per rule and tag rejected rows with it.
+
+Checks:
+    "prefix"   the text field starts with the argument
+    "parses"   the field parses as its column type (Quantity, Date, ...)
+    "min"      the parsed value is >= the argument
+    "gt"       the parsed value is > the argument
+
+A value that fails to parse breaks whichever rule first needs it, and a
+text/bytes row with fewer fields than the layout breaks MISSING_FIELDS,
+so a malformed row is rejected instead of raising.
+"""
+from utils.money import safe_bytes_to_paise, safe_to_paise
+from utils.transactions import TRANSACTION_FIELDS
+
+MISSING_FIELDS = "missing_fields"
+CHECKS = ("prefix", "parses", "min", "gt")
+MODES = ("text", "bytes", "record")
+
+
+class Rule:
+    __slots__ = ("name", "field", "check", "argument")
+
+    def __init__(self, name, field, check, argument=None):
+        if check not in CHECKS:
+            raise ValueError(f"Unknown check {check!r}; expected one of {', '.join(CHECKS)}")
+        self.name = name
+        self.field = field
+        self.check = check
+        self.argument = argument
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, {self.field!r}, {self.check!r}, {self.argument!r})"
+
+
+def _converters(mode):
+    """Column parsers used by the text/bytes predicates, matching parse_row."""
+    # imported here: file_handler itself compiles rule sets from this module
+    from utils.file_handler import parse_iso_date
+
+    if mode == "bytes":
+        return {
+            "Quantity": int,
+            "UnitPrice": safe_bytes_to_paise,
+            "Date": lambda b: parse_iso_date(b.decode("ascii")),
+        }
+    return {"Quantity": int, "UnitPrice": safe_to_paise, "Date": parse_iso_date}
+
+
+def _compile(rules, fields, mode):
+    """Generates and compiles check(row) -> failing rule name or None."""
+    converters = {} if mode == "record" else _converters(mode)
+    # each parser is bound as its own global of the generated function
+    namespace = {f"_parse_{field}": parse for field, parse in converters.items()}
+    lines = ["def check(row):"]
+    if mode != "record":
+        lines += [f"    if len(row) < {len(fields)}:", f"        return {MISSING_FIELDS!r}"]
+
+    parsed = {}
+    for rule in rules:
+        index = fields.index(rule.field)
+        if mode == "record":
+            raw = f"row.get({rule.field!r})"
+        else:
+            raw = f"row[{index}]"
+
+        if rule.check == "prefix":
+            prefix = rule.argument.encode("ascii") if mode == "bytes" else rule.argument
+            source = f"({raw} or {prefix[:0]!r})" if mode == "record" else raw
+            lines += [f"    if not {source}.startswith({prefix!r}):", f"        return {rule.name!r}"]
+            continue
+
+        value = parsed.get(rule.field)
+        if value is None:
+            value = parsed[rule.field] = f"v{index}"
+            if mode == "record":
+                lines.append(f"    {value} = row.get({rule.field!r}, 0)")
+            elif rule.field in converters:
+                lines += [
+                    "    try:",
+                    f"        {value} = _parse_{rule.field}({raw})",
+                    "    except ValueError:",
+                    f"        return {rule.name!r}",
+                ]
+            else:
+                lines.append(f"    {value} = {raw}")
+
+        if rule.check == "min":
+            lines += [f"    if not {value} >= {rule.argument!r}:", f"        return {rule.name!r}"]
+        elif rule.check == "gt":
+            lines += [f"    if not {value} > {rule.argument!r}:", f"        return {rule.name!r}"]
+    lines.append("    return None")
+
+    exec(compile("\n".join(lines), f"<rules:{mode}>", "exec"), namespace)
+    return namespace["check"]
+
+
+class RuleSet:
+    """
+    An ordered set of Rules over one row layout, compiled lazily (and once)
+    per mode. RuleSets add: CLEANING_RULES + VALIDITY_RULES checks a raw
+    row against both in one call.
+    """
+
+    def __init__(self, rules, fields=TRANSACTION_FIELDS):
+        self.rules = tuple(rules)
+        self.fields = tuple(fields)
+        for rule in self.rules:
+            if rule.field not in self.fields:
+                raise ValueError(f"Rule {rule.name!r} checks unknown field {rule.field!r}")
+        self._compiled = {}
+
+    def __add__(self, other):
+        return RuleSet(self.rules + other.rules, self.fields)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __repr__(self):
+        return f"RuleSet({', '.join(rule.name for rule in self.rules)})"
+
+    @property
+    def names(self):
+        return (MISSING_FIELDS,) + tuple(rule.name for rule in self.rules)
+
+    def predicate(self, mode="text"):
+        check = self._compiled.get(mode)
+        if check is None:
+            if mode not in MODES:
+                raise ValueError(f"Unknown mode {mode!r}; expected one of {', '.join(MODES)}")
+            check = self._compiled[mode] = _compile(self.rules, self.fields, mode)
+        return check
+
+
+def count_reject(counters, rule, n=1):
+    """Bumps counters["rejected"][rule], the per-rule reject counts."""
+    rejected = counters.get("rejected")
+    if rejected is None:
+        rejected = counters["rejected"] = {}
+    rejected[rule] = rejected.get(rule, 0) + n
+
+def merge_rejects(target, source):
+    for rule, n in source.get("rejected", {}).items():
+        count_reject(target, rule, n)
+
+
+# the Q1 cleaning rules, in the order handleQuestionOne used to apply them
+CLEANING_RULES = RuleSet((
+    Rule("customer_id_prefix", "CustomerID", "prefix", "C"),
+    Rule("quantity_is_integer", "Quantity", "parses"),
+    Rule("quantity_non_negative", "Quantity", "min", 0),
+    Rule("unit_price_non_negative", "UnitPrice", "min", 0),
+    Rule("transaction_id_prefix", "TransactionID", "prefix", "T"),
+    Rule("date_is_iso", "Date", "parses"),
+))
+
+# validate_and_filter's validity rules on parsed (or raw) records
+VALIDITY_RULES = RuleSet((
+    Rule("quantity_positive", "Quantity", "gt", 0),
+    Rule("unit_price_positive", "UnitPrice", "gt", 0),
+))
+
+# both, for single-pass cleaning + validation of raw rows
+INGEST_RULES = CLEANING_RULES + VALIDITY_RULES